@@ -48,6 +48,8 @@ INSTALLED_APPS = INSTALLED_APPS_DJANGO + INSTALLED_APPS_LOCAL
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'app.middleware.CachedGZipMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -91,6 +93,24 @@ DATABASES = {
     },
 }
 
+# Read-only replica of the default database. Dashboard reads go to it when
+# POSTGRES_REPLICA_HOST is set, see app.routers.
+DATABASES['replica'] = {
+    'ENGINE': 'django.db.backends.postgresql',
+    'NAME': os.environ['POSTGRES_NAME'],
+    'USER': os.environ['POSTGRES_USER'],
+    'PASSWORD': os.environ['POSTGRES_PASSWORD'],
+    'HOST': os.environ.get('POSTGRES_REPLICA_HOST', os.environ['POSTGRES_HOST']),
+    'PORT': int(os.environ.get('POSTGRES_REPLICA_PORT', os.environ['POSTGRES_PORT'])),
+    'TEST': {
+        'MIRROR': 'default',
+    },
+}
+
+DATABASE_REPLICA = 'replica' if os.environ.get('POSTGRES_REPLICA_HOST') else None
+
+DATABASE_ROUTERS = ['app.routers.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -211,4 +231,86 @@ SECURE_CONTENT_TYPE_NOSNIFF = True
 # Days to wait to refresh the database from sources
 DATA_REFRESH_DAYS = 1
 
+# Seconds to keep the compressed body of responses with an ETag
+GZIP_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Maximum points per plot trace, series get downsampled (LTTB) above it
+PLOT_MAX_POINTS = 2000
+
+# Point budgets of the viewport widths get rounded down to a multiple of it,
+# so close widths share their cached dashboards
+PLOT_POINTS_STEP = 250
+
+# Points per plot trace above which WebGL gets used to render it
+PLOT_WEBGL_THRESHOLD = 1000
+
+# Periods averaged by default in moving averages, and the maximum allowed
+MOVING_AVERAGE_WINDOW = 7
+MAX_MOVING_AVERAGE_WINDOW = 365
+
+# Campaign options rendered in the dashboard, by clicks. The rest are
+# reachable through the search endpoint.
+MAX_CAMPAIGN_OPTIONS = 50
+
+# Rows sampled, about, by the approximate mode of the dashboard and the data
+# endpoint. Its latency is bounded by it regardless of the table size.
+APPROXIMATE_SAMPLE_ROWS = 100000
+
+# Results per page of the search endpoint, by default and at most
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
+# Groups returned by the breakdown endpoint, by default and at most
+BREAKDOWN_SIZE = 20
+BREAKDOWN_MAX_SIZE = 100
+
+# Rows fetched per round trip by the server-side cursor of the exports
+EXPORT_CHUNK_SIZE = 2000
+
+# Seconds to keep computed dashboards (plot and options) in the cache
+DASHBOARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Most requested dashboards computed after every ingest, and the threads
+# computing them
+CACHE_WARMING_SIZE = 20
+CACHE_WARMING_WORKERS = 4
+
+# Share of the dashboard requests counted for cache warming, sparing most of
+# them a write, and days after which unused selections are forgotten
+FILTER_SELECTION_SAMPLE_RATE = 0.1
+FILTER_SELECTION_MAX_AGE_DAYS = 30
+
+# Directory where every stored CSV is also written as a columnar snapshot,
+# see app.snapshot. None to disable them.
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR')
+
+# Fetch only the bytes added to the source since the latest ingest run,
+# adding their rows to the current data instead of replacing it
+DATA_APPEND_ONLY = os.environ.get('DATA_APPEND_ONLY', '').lower() == 'true'
+
+# Directory where the source gets downloaded before being processed
+DOWNLOAD_DIR = os.environ.get('DOWNLOAD_DIR', '/tmp')
+
+# Bytes read from the source between download checkpoints
+INGEST_CHUNK_SIZE = 1024 * 1024
+
+# Rows committed to the database per transaction during ingests
+INGEST_BATCH_SIZE = 5000
+
+# Connections writing the rows of an ingest concurrently. Above 1, they are
+# staged and published at once, see app.storage.save_data.
+INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', 1))
+
+# Seconds without progress after which an unfinished ingest run is
+# considered interrupted and gets resumed
+INGEST_RESUME_SECONDS = 300
+
+# Seconds between the touches marking an ingest run as in progress, well
+# below INGEST_RESUME_SECONDS
+INGEST_HEARTBEAT_SECONDS = 60
+
+# Seconds the source may take to accept the connection or send more bytes
+# before the download fails, to be resumed later
+INGEST_TIMEOUT = 60
+
 ENDPOINT_URL = 'http://adverity-challenge.s3-website-eu-west-1.amazonaws.com/DAMKBAoDBwoDBAkOBAYFCw.csv'
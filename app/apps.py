@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class AdverityAppConfig(AppConfig):
     name = 'app'
+
+    def ready(self):
+        from .signals import data_stored
+        from .warming import warm_cache
+        data_stored.connect(warm_cache, dispatch_uid='app.warming.warm_cache')
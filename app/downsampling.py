@@ -0,0 +1,48 @@
+from typing import List, Sequence
+
+
+def lttb(x: Sequence[float], y: Sequence[float], threshold: int) -> List[int]:
+    """
+    Largest-Triangle-Three-Buckets downsampling. Returns the indexes of the
+    points to keep, so the caller can pick them from any parallel sequence.
+
+    The first and last points are always kept. When the series already fits
+    into the threshold, every index is returned.
+    """
+    length = len(x)
+    if threshold >= length or threshold < 3:
+        return list(range(length))
+
+    indexes = [0]
+    bucket_size = (length - 2) / (threshold - 2)
+    selected = 0
+
+    for i in range(threshold - 2):
+        # Average point of the next bucket, used as the third triangle vertex
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, length)
+        next_count = next_end - next_start
+        avg_x = sum(x[next_start:next_end]) / next_count
+        avg_y = sum(y[next_start:next_end]) / next_count
+
+        # Point of the current bucket forming the largest triangle
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        point_x = x[selected]
+        point_y = y[selected]
+        max_area = -1.0
+        selected_in_bucket = start
+        for j in range(start, end):
+            area = abs(
+                (point_x - avg_x) * (y[j] - point_y) -
+                (point_x - x[j]) * (avg_y - point_y)
+            )
+            if area > max_area:
+                max_area = area
+                selected_in_bucket = j
+
+        selected = selected_in_bucket
+        indexes.append(selected)
+
+    indexes.append(length - 1)
+    return indexes
@@ -1,17 +1,29 @@
+from collections import Counter
 import csv
 from datetime import datetime
-from io import StringIO
 import logging
 import re
-from typing import List, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# Reasons why a row gets rejected
+INVALID_DATE = 'invalid_date'
+INVALID_DATA_SOURCE = 'invalid_data_source'
+INVALID_CAMPAIGN = 'invalid_campaign'
+INVALID_CLICKS = 'invalid_clicks'
+INVALID_IMPRESSIONS = 'invalid_impressions'
+
 
 class CSVData:
-    def __init__(self, content: StringIO):
+    # Rejected rows logged individually, the rest are just counted
+    rejected_log_limit = 10
+
+    def __init__(self, content: Iterable[str]):
         self._content = content
         self._data: List[dict] = []
+        self._rejected_rows: List[Tuple[int, str, dict]] = []
+        self._rejected_counts: Counter = Counter()
         self._data_sources: Tuple = tuple()
         self._campaigns: Tuple = tuple()
 
@@ -19,6 +31,17 @@ class CSVData:
     def cleaned_data(self) -> List[dict]:
         return self._data
 
+    @property
+    def rejected_rows(self) -> List[Tuple[int, str, dict]]:
+        """
+        Line number, rejection reason and content of every invalid row.
+        """
+        return self._rejected_rows
+
+    @property
+    def rejected_counts(self) -> Dict[str, int]:
+        return dict(self._rejected_counts)
+
     @property
     def data_sources(self) -> tuple:
         return self._data_sources
@@ -35,12 +58,15 @@ class CSVData:
         csv_reader = csv.DictReader(self._content)
 
         self._data.clear()
+        self._rejected_rows.clear()
+        self._rejected_counts.clear()
         data_sources = set()
         campaigns = set()
 
         for row in csv_reader:
-            if not self._is_valid_data(row):
-                logger.info(f'Invalid data. Skipped row: {row}')
+            reason = self._get_rejection_reason(row)
+            if reason is not None:
+                self._reject(csv_reader.line_num, reason, row)
                 continue
 
             data_source: str = row['Datasource']
@@ -59,21 +85,48 @@ class CSVData:
         self._data_sources = tuple(sorted(data_sources))
         self._campaigns = tuple(sorted(campaigns))
 
+        if self._rejected_counts:
+            logger.warning(
+                'Skipped %d invalid rows: %s',
+                len(self._rejected_rows), self.rejected_counts,
+            )
+
+    def _reject(self, line_number: int, reason: str, row: dict) -> None:
+        self._rejected_rows.append((line_number, reason, row))
+        self._rejected_counts[reason] += 1
+        if len(self._rejected_rows) <= self.rejected_log_limit:
+            logger.debug(
+                'Invalid data (%s). Skipped line %d: %s',
+                reason, line_number, row,
+            )
+
     @staticmethod
     def _is_valid_data(row: dict) -> bool:
-        if not re.match(r'^\d{2}\.\d{2}\.\d{4}$', row['Date']):
-            return False
+        return CSVData._get_rejection_reason(row) is None
+
+    @staticmethod
+    def _get_rejection_reason(row: dict) -> Optional[str]:
+        """
+        Returns why the row is invalid, None when it is valid.
+        """
+        if (not isinstance(row['Date'], str) or
+                not re.match(r'^\d{2}\.\d{2}\.\d{4}$', row['Date'])):
+            return INVALID_DATE
 
         if not isinstance(row['Datasource'], str) or not row['Datasource']:
-            return False
+            return INVALID_DATA_SOURCE
 
         if not isinstance(row['Campaign'], str) or not row['Campaign']:
-            return False
+            return INVALID_CAMPAIGN
 
         try:
             int(row['Clicks'])
+        except (TypeError, ValueError):
+            return INVALID_CLICKS
+
+        try:
             int(row['Impressions'])
-        except ValueError:
-            return False
+        except (TypeError, ValueError):
+            return INVALID_IMPRESSIONS
 
-        return True
+        return None
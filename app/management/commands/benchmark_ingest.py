@@ -0,0 +1,73 @@
+from datetime import date, timedelta
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...extraction import CSVData
+from ...models import DataSource, IngestRun
+from ...storage import save_data
+
+
+def get_synthetic_data(rows: int, prefix: str) -> CSVData:
+    """
+    Processed CSV with `rows` distinct rows, spread over a few data sources
+    and campaigns.
+    """
+    first_date = date(2019, 1, 1)
+    lines = ['Date,Datasource,Campaign,Clicks,Impressions\n']
+    for i in range(rows):
+        day = first_date + timedelta(days=i % 365)
+        lines.append(
+            f'{day:%d.%m.%Y},{prefix} source {i % 5},'
+            f'{prefix} campaign {i % 50},{i},{i * 10}\n'
+        )
+    csv_data = CSVData(lines)
+    csv_data.process()
+    return csv_data
+
+
+class Command(BaseCommand):
+    help = (
+        'Times the storage of synthetic rows with different numbers of '
+        'ingest workers. The rows are removed afterwards, but they are the '
+        'latest data once stored: use a database nobody is reading.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, default=200000, help='Rows stored per run',
+        )
+        parser.add_argument(
+            '--workers', type=int, nargs='+', default=[1, 2, 4, 8],
+            help='Numbers of workers to time',
+        )
+
+    def handle(self, *args, **options):
+        prefix = f'benchmark {time.time():.0f}'
+        baseline = None
+        try:
+            for workers in options['workers']:
+                # Storing consumes the processed rows
+                data = get_synthetic_data(options['rows'], prefix)
+                elapsed = self.time_run(data, workers)
+                if baseline is None:
+                    baseline = elapsed
+                self.stdout.write(
+                    f'{workers} workers: {elapsed:.2f}s, '
+                    f'{options["rows"] / elapsed:.0f} rows/s, '
+                    f'{baseline / elapsed:.2f}x'
+                )
+        finally:
+            DataSource.objects.filter(
+                name__startswith=f'{prefix} source ',
+            ).delete()
+
+    @staticmethod
+    def time_run(data: CSVData, workers: int) -> float:
+        run = IngestRun.objects.create(url=f'urn:benchmark:{time.time()}')
+        start = time.perf_counter()
+        save_data(data, run, workers=workers)
+        elapsed = time.perf_counter() - start
+        # Removes its rows too
+        run.delete()
+        return elapsed
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from ...snapshot import Snapshot
+from ...storage import save_data
+
+
+class Command(BaseCommand):
+    help = (
+        'Stores the data of a columnar snapshot in the database, without '
+        'downloading nor parsing the CSV again. Its rows keep the date the '
+        'snapshot was written as date_created.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Snapshot directory')
+
+    def handle(self, *args, **options):
+        snapshot = Snapshot(options['path'])
+        save_data(snapshot, generation=snapshot.date_created)
+        self.stdout.write(
+            f'Stored {snapshot.manifest["rows"]} rows from {options["path"]}'
+        )
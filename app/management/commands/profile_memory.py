@@ -0,0 +1,160 @@
+import json
+import os
+from pathlib import Path
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, List
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory, override_settings
+
+from ...extraction import CSVData
+from ...signals import data_stored
+from ...storage import _claim_run, _get_data, _store_csv_data
+from ...views import IndexView
+from ...warming import warm_cache
+
+WARM_CACHE_UID = 'app.warming.warm_cache'
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs the refresh pipeline on a CSV file (download, processing, '
+        'storage and dashboard render) and reports the memory allocated by '
+        'each stage, as JSON. Everything is rolled back afterwards, unless '
+        '--commit is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file in the feed format')
+        parser.add_argument(
+            '--query', default='',
+            help='Query string of the rendered dashboard, e.g. '
+                 '"data-sources=Google+Adwords&granularity=week"',
+        )
+        parser.add_argument(
+            '--top', type=int, default=10,
+            help='Allocation sites reported per stage',
+        )
+        parser.add_argument(
+            '--frames', type=int, default=1,
+            help='Frames of the traceback identifying an allocation site',
+        )
+        parser.add_argument(
+            '--commit', action='store_true',
+            help='Keep the stored rows as the latest data, like a refresh',
+        )
+
+    def handle(self, *args, **options):
+        self.top = options['top']
+        self.frames = options['frames']
+        self.stages: List[dict] = []
+        url = Path(options['path']).resolve().as_uri()
+
+        # The render gets computed rather than read from the cache, and the
+        # stored data does not trigger the cache warming
+        data_stored.disconnect(dispatch_uid=WARM_CACHE_UID)
+        try:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                snapshot_dir = settings.SNAPSHOT_DIR
+                if snapshot_dir and not options['commit']:
+                    snapshot_dir = temp_dir
+                with override_settings(
+                    ENDPOINT_URL=url,
+                    DOWNLOAD_DIR=temp_dir,
+                    SNAPSHOT_DIR=snapshot_dir,
+                    CACHES={'default': {
+                        'BACKEND':
+                            'django.core.cache.backends.dummy.DummyCache',
+                    }},
+                    # Workers could not see the rows of the transaction
+                    INGEST_WORKERS=1,
+                ), transaction.atomic():
+                    csv_data = self.run_pipeline(options['query'])
+                    if not options['commit']:
+                        transaction.set_rollback(True)
+        finally:
+            data_stored.connect(warm_cache, dispatch_uid=WARM_CACHE_UID)
+
+        # Kilobytes on Linux
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        report = {
+            'path': options['path'],
+            'python': sys.version.split()[0],
+            'rows': len(csv_data.cleaned_data),
+            'max_rss': max_rss,
+            'stages': self.stages,
+        }
+        self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
+
+    def run_pipeline(self, query: str) -> CSVData:
+        run = _claim_run()
+        if run is None:
+            raise CommandError('The file is already being stored')
+
+        content = self.profile('get_data', lambda: _get_data(run))
+        csv_data = CSVData(content)
+        self.profile('process', csv_data.process)
+        content.close()
+        self.profile('store_data', lambda: _store_csv_data(csv_data, run))
+        request = RequestFactory().get(f'/?{query}')
+        self.profile('render', lambda: IndexView.as_view()(request).render())
+        return csv_data
+
+    def profile(self, name: str, function: Callable):
+        """
+        Calls the function tracing its allocations. Tracing restarts for
+        every stage, so its peak only covers the memory the stage allocated
+        (tracemalloc.reset_peak needs Python 3.9).
+        """
+        tracemalloc.start(self.frames)
+        start = time.perf_counter()
+        try:
+            return function()
+        finally:
+            seconds = time.perf_counter() - start
+            retained, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+            ])
+            tracemalloc.stop()
+            self.add_stage(name, seconds, peak, retained, snapshot)
+
+    def add_stage(self, name: str, seconds: float, peak: int, retained: int,
+                  snapshot: tracemalloc.Snapshot) -> None:
+        key_type = 'traceback' if self.frames > 1 else 'lineno'
+        sites = [
+            {
+                'traceback': [
+                    f'{self.get_path(frame.filename)}:{frame.lineno}'
+                    for frame in statistic.traceback
+                ],
+                'size': statistic.size,
+                'count': statistic.count,
+            }
+            for statistic in snapshot.statistics(key_type)[:self.top]
+        ]
+
+        self.stages.append({
+            'name': name,
+            'seconds': seconds,
+            'peak': peak,
+            'retained': retained,
+            'top': sites,
+        })
+
+    @staticmethod
+    def get_path(filename: str) -> str:
+        """
+        Paths relative to the project or to the Python installation, so
+        reports of different machines can be compared.
+        """
+        for base in (settings.BASE_DIR, sys.prefix, sys.base_prefix):
+            if filename.startswith(base + os.sep):
+                return os.path.relpath(filename, base)
+        return filename
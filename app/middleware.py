@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.middleware.gzip import GZipMiddleware, re_accepts_gzip
+from django.utils.cache import patch_vary_headers
+
+
+class CachedGZipMiddleware(GZipMiddleware):
+    """
+    Keeps the compressed body of responses with an ETag in the cache, so
+    every version of a page gets compressed just once. The cache key has the
+    path too, as different pages may share an ETag.
+    """
+    def process_response(self, request, response):
+        etag = response.get('ETag')
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if (
+            response.streaming or
+            response.status_code != 200 or
+            not etag or
+            response.has_header('Content-Encoding') or
+            not re_accepts_gzip.search(accept_encoding)
+        ):
+            return super().process_response(request, response)
+
+        cache_key = f'gzip:{request.path}:{etag}'
+        compressed_content = cache.get(cache_key)
+        if compressed_content is None:
+            response = super().process_response(request, response)
+            if response.get('Content-Encoding') == 'gzip':
+                cache.set(
+                    cache_key, response.content, settings.GZIP_CACHE_TIMEOUT
+                )
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        response.content = compressed_content
+        response['Content-Length'] = str(len(compressed_content))
+        if etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = 'gzip'
+        return response
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.5 on 2026-10-19 18:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rowdata',
+            index=models.Index(fields=['date_created', 'date'], name='rowdata_created_date_idx'),
+        ),
+    ]
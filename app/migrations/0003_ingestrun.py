@@ -0,0 +1,28 @@
+# Generated by Django 2.2.5 on 2026-10-19 18:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_rowdata_created_date_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+                ('date_finished', models.DateTimeField(db_index=True, null=True)),
+                ('url', models.URLField(max_length=2000)),
+                ('etag', models.CharField(blank=True, max_length=200)),
+                ('header', models.TextField(blank=True)),
+                ('start_offset', models.BigIntegerField(default=0)),
+                ('bytes_fetched', models.BigIntegerField(default=0)),
+                ('batches_committed', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
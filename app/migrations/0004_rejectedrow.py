@@ -0,0 +1,24 @@
+# Generated by Django 2.2.5 on 2026-10-19 18:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_ingestrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RejectedRow',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('line_number', models.IntegerField()),
+                ('reason', models.CharField(db_index=True, max_length=50)),
+                ('content', models.TextField()),
+                ('ingest_run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rejected_rows', to='app.IngestRun')),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.5 on 2026-10-19 18:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_rejectedrow'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='rowdata',
+            name='unique RowData',
+        ),
+        migrations.AddConstraint(
+            model_name='rowdata',
+            constraint=models.UniqueConstraint(fields=('date_created', 'date', 'data_source', 'campaign', 'clicks', 'impressions'), name='unique RowData per date_created'),
+        ),
+    ]
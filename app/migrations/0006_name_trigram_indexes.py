@@ -0,0 +1,25 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_rowdata_unique_per_date_created'),
+    ]
+
+    # GIN trigram indexes on the expression Django uses for icontains and
+    # istartswith lookups, UPPER(name::text), so both get served by them.
+    operations = [
+        TrigramExtension(),
+        migrations.RunSQL(
+            sql='CREATE INDEX app_campaign_name_trgm ON app_campaign '
+                'USING gin ((UPPER("name"::text)) gin_trgm_ops);',
+            reverse_sql='DROP INDEX app_campaign_name_trgm;',
+        ),
+        migrations.RunSQL(
+            sql='CREATE INDEX app_datasource_name_trgm ON app_datasource '
+                'USING gin ((UPPER("name"::text)) gin_trgm_ops);',
+            reverse_sql='DROP INDEX app_datasource_name_trgm;',
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.2.5 on 2026-10-19 21:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_name_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FilterSelection',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=40, unique=True)),
+                ('filters', models.TextField()),
+                ('max_points', models.IntegerField(null=True)),
+                ('hits', models.IntegerField(db_index=True, default=0)),
+                ('date_last_used', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 2.2.5 on 2026-10-20 09:14
+
+from django.db import migrations, models
+
+
+def delete_superseded_runs(apps, schema_editor):
+    """
+    Keeps the latest unfinished run of every feed, the one that gets
+    resumed.
+    """
+    IngestRun = apps.get_model('app', 'IngestRun')
+    unfinished = IngestRun.objects.filter(date_finished__isnull=True)
+    latest = {}
+    for run in unfinished.order_by('id'):
+        latest[run.url] = run.id
+    unfinished.exclude(id__in=latest.values()).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_filterselection'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StagedRowData',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stage', models.CharField(db_index=True, max_length=40)),
+                ('batch', models.IntegerField()),
+                ('date', models.DateField()),
+                ('data_source_id', models.IntegerField()),
+                ('campaign_id', models.IntegerField()),
+                ('clicks', models.IntegerField()),
+                ('impressions', models.IntegerField()),
+            ],
+        ),
+        # Staged rows are published within minutes, or staged again by a
+        # resumed ingest, so they do not need to survive a crash.
+        migrations.RunSQL(
+            sql='ALTER TABLE app_stagedrowdata SET UNLOGGED;',
+            reverse_sql='ALTER TABLE app_stagedrowdata SET LOGGED;',
+        ),
+        migrations.RunPython(
+            delete_superseded_runs, migrations.RunPython.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='ingestrun',
+            constraint=models.UniqueConstraint(condition=models.Q(date_finished__isnull=True), fields=('url',), name='one unfinished IngestRun per url'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 2.2.5 on 2026-10-21 10:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def restart_unfinished_runs(apps, schema_editor):
+    """
+    Unfinished runs write their rows again, the ones they staged go with
+    the staging table.
+    """
+    IngestRun = apps.get_model('app', 'IngestRun')
+    IngestRun.objects.filter(
+        date_finished__isnull=True,
+    ).update(
+        batches_committed=0,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_stagedrowdata'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            restart_unfinished_runs, migrations.RunPython.noop,
+        ),
+        migrations.DeleteModel(
+            name='StagedRowData',
+        ),
+        migrations.AddField(
+            model_name='ingestrun',
+            name='generation',
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name='rowdata',
+            name='run',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='app.IngestRun'),
+        ),
+        migrations.AddIndex(
+            model_name='rowdata',
+            index=models.Index(condition=models.Q(run__isnull=True), fields=['id'], name='rowdata_without_run_idx'),
+        ),
+        migrations.CreateModel(
+            name='IngestBatch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.IntegerField()),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='batches', to='app.IngestRun')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='ingestbatch',
+            constraint=models.UniqueConstraint(fields=('run', 'index'), name='unique IngestBatch per run'),
+        ),
+    ]
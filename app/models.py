@@ -34,13 +34,160 @@ class RowData(models.Model):
     campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE)
     clicks = models.IntegerField()
     impressions = models.IntegerField()
+    # Ingest that stored the row, which is only published once it finishes,
+    # see app.storage.get_published_rows. None for rows stored before runs.
+    run = models.ForeignKey(
+        'IngestRun',
+        null=True,
+        on_delete=models.CASCADE,
+    )
 
     class Meta:
+        indexes = [
+            # Every query is scoped to a single date_created snapshot, and
+            # most of them to a date range within it.
+            models.Index(
+                fields=['date_created', 'date'],
+                name='rowdata_created_date_idx',
+            ),
+            # Newest row stored without a run, see
+            # app.storage.get_dataset_version
+            models.Index(
+                fields=['id'],
+                name='rowdata_without_run_idx',
+                condition=models.Q(run__isnull=True),
+            ),
+        ]
         constraints = [
+            # Unique per date_created, so every day can store a full
+            # snapshot of the source.
             models.UniqueConstraint(
                 fields=[
-                    'date', 'data_source', 'campaign', 'clicks', 'impressions'
+                    'date_created', 'date', 'data_source', 'campaign',
+                    'clicks', 'impressions',
                 ],
-                name='unique RowData',
+                name='unique RowData per date_created',
             )
         ]
+
+
+class IngestRun(models.Model):
+    """
+    A download and storage of the source feed. It works as a checkpoint, so
+    an interrupted run can be resumed where it stopped.
+    """
+    date_created = models.DateTimeField(
+        auto_now_add=True,
+        editable=False,
+    )
+    date_updated = models.DateTimeField(
+        auto_now=True,
+        editable=False,
+    )
+    date_finished = models.DateTimeField(
+        db_index=True,
+        null=True,
+    )
+    url = models.URLField(
+        max_length=2000,
+    )
+    etag = models.CharField(
+        blank=True,
+        max_length=200,
+    )
+    # CSV header line, also needed by later append-only runs
+    header = models.TextField(
+        blank=True,
+    )
+    # Position in the feed where this run started (>0 for append-only runs)
+    start_offset = models.BigIntegerField(
+        default=0,
+    )
+    bytes_fetched = models.BigIntegerField(
+        default=0,
+    )
+    batches_committed = models.IntegerField(
+        default=0,
+    )
+    # date_created of the rows of the run, kept when it gets resumed
+    generation = models.DateField(
+        null=True,
+    )
+
+    class Meta:
+        constraints = [
+            # A feed gets stored by one run at a time
+            models.UniqueConstraint(
+                fields=['url'],
+                condition=models.Q(date_finished__isnull=True),
+                name='one unfinished IngestRun per url',
+            ),
+        ]
+
+    @property
+    def end_offset(self) -> int:
+        return self.start_offset + self.bytes_fetched
+
+
+class IngestBatch(models.Model):
+    """
+    Batch of rows written by an ingest run, not written again when the run
+    gets resumed.
+    """
+    run = models.ForeignKey(
+        IngestRun,
+        on_delete=models.CASCADE,
+        related_name='batches',
+    )
+    # Number of the batch in the run
+    index = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['run', 'index'],
+                name='unique IngestBatch per run',
+            ),
+        ]
+
+
+class RejectedRow(models.Model):
+    """
+    Source row skipped because it was invalid, kept for inspection.
+    """
+    ingest_run = models.ForeignKey(
+        IngestRun,
+        on_delete=models.CASCADE,
+        related_name='rejected_rows',
+    )
+    line_number = models.IntegerField()
+    reason = models.CharField(
+        db_index=True,
+        max_length=50,
+    )
+    # JSON of the row as read from the CSV
+    content = models.TextField()
+
+
+class FilterSelection(models.Model):
+    """
+    Dashboard filters requested by users, used to warm up the cache of the
+    most popular ones after every data refresh.
+    """
+    # Hash of the normalized filters
+    key = models.CharField(
+        max_length=40,
+        unique=True,
+    )
+    # Normalized filters as JSON
+    filters = models.TextField()
+    max_points = models.IntegerField(
+        null=True,
+    )
+    hits = models.IntegerField(
+        db_index=True,
+        default=0,
+    )
+    date_last_used = models.DateTimeField(
+        auto_now=True,
+    )
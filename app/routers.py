@@ -0,0 +1,61 @@
+from contextlib import contextmanager
+import logging
+import threading
+from typing import Iterator
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from .storage import get_dataset_version
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+
+
+@contextmanager
+def replica_reads() -> Iterator[str]:
+    """
+    Routes the reads of the block to the DATABASE_REPLICA alias, unless the
+    replica lags behind the primary's dataset version. Yields the alias
+    being read from.
+    """
+    alias = _get_read_alias()
+    previous_alias = getattr(_state, 'alias', None)
+    _state.alias = alias
+    try:
+        yield alias
+    finally:
+        _state.alias = previous_alias
+
+
+def _get_read_alias() -> str:
+    replica = settings.DATABASE_REPLICA
+    if not replica:
+        return DEFAULT_DB_ALIAS
+
+    primary_version = get_dataset_version(using=DEFAULT_DB_ALIAS)
+    replica_version = get_dataset_version(using=replica)
+    if replica_version != primary_version:
+        logger.info(
+            'Replica %s at version %r, primary at %r. Reading from primary.',
+            replica, replica_version, primary_version,
+        )
+        return DEFAULT_DB_ALIAS
+    return replica
+
+
+class ReplicaRouter:
+    """
+    Sends reads to the replica inside replica_reads() blocks. Everything
+    else, including all writes, goes to the primary.
+    """
+    def db_for_read(self, model, **hints):
+        return getattr(_state, 'alias', None)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
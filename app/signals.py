@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+# Sent with the IngestRun as `run` once its data is stored
+data_stored = Signal(providing_args=['run'])
@@ -0,0 +1,139 @@
+from datetime import date, datetime
+import json
+import os
+import tempfile
+from typing import Dict, Iterator, Tuple
+
+import numpy as np
+
+from .extraction import CSVData
+
+FORMAT_VERSION = 1
+
+MANIFEST_FILE = 'manifest.json'
+
+DIMENSIONS_FILE = 'dimensions.json'
+
+COLUMN_DTYPES = {
+    'date': 'datetime64[D]',
+    'data_source': 'int32',
+    'campaign': 'int32',
+    'clicks': 'int64',
+    'impressions': 'int64',
+}
+
+
+def write_snapshot(directory: str, csv_data: CSVData,
+                   generation: date) -> str:
+    """
+    Writes the processed data as a columnar snapshot in a new subdirectory
+    of `directory` and returns its path. Each column is a .npy file, data
+    sources and campaigns get encoded as indexes of the dimensions file.
+    `generation` is the date_created of the rows.
+    """
+    data_sources = {name: i for i, name in enumerate(csv_data.data_sources)}
+    campaigns = {name: i for i, name in enumerate(csv_data.campaigns)}
+    rows = csv_data.cleaned_data
+
+    columns = {
+        'date': [data['date'] for data in rows],
+        'data_source': [data_sources[data['data_source']] for data in rows],
+        'campaign': [campaigns[data['campaign']] for data in rows],
+        'clicks': [data['clicks'] for data in rows],
+        'impressions': [data['impressions'] for data in rows],
+    }
+
+    # Written in a temporary directory first, so readers never see
+    # incomplete snapshots.
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=directory, prefix='.tmp-')
+    for name, values in columns.items():
+        array = np.array(values, dtype=COLUMN_DTYPES[name])
+        np.save(os.path.join(tmp_path, f'{name}.npy'), array)
+
+    with open(os.path.join(tmp_path, DIMENSIONS_FILE), 'w') as f:
+        json.dump({
+            'data_sources': list(csv_data.data_sources),
+            'campaigns': list(csv_data.campaigns),
+        }, f)
+
+    with open(os.path.join(tmp_path, MANIFEST_FILE), 'w') as f:
+        json.dump({
+            'format_version': FORMAT_VERSION,
+            'date_created': generation.isoformat(),
+            'rows': len(rows),
+            'columns': COLUMN_DTYPES,
+        }, f)
+
+    path = os.path.join(
+        directory, datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+    )
+    os.rename(tmp_path, path)
+    return path
+
+
+class Snapshot:
+    """
+    Read-only access to a columnar snapshot. Columns are memory-mapped, so
+    opening it is almost free and processes share the same pages.
+
+    It exposes the same properties as CSVData, so it can be stored the same
+    way.
+    """
+    def __init__(self, path: str, chunk_size: int = 10000):
+        self._path = path
+        self._chunk_size = chunk_size
+
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+        if self.manifest['format_version'] != FORMAT_VERSION:
+            raise ValueError(
+                f'Unsupported snapshot format: '
+                f'{self.manifest["format_version"]}'
+            )
+
+        with open(os.path.join(path, DIMENSIONS_FILE)) as f:
+            dimensions = json.load(f)
+        self._data_sources: Tuple = tuple(dimensions['data_sources'])
+        self._campaigns: Tuple = tuple(dimensions['campaigns'])
+
+        self.columns: Dict[str, np.ndarray] = {
+            name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+            for name in self.manifest['columns']
+        }
+
+    @property
+    def cleaned_data(self) -> Iterator[dict]:
+        """
+        Decodes the rows chunk by chunk, never holding all of them as Python
+        objects.
+        """
+        for start in range(0, self.manifest['rows'], self._chunk_size):
+            end = start + self._chunk_size
+            chunk = zip(*(
+                self.columns[name][start:end].tolist()
+                for name in COLUMN_DTYPES
+            ))
+            for day, data_source, campaign, clicks, impressions in chunk:
+                yield {
+                    'date': day,
+                    'data_source': self._data_sources[data_source],
+                    'campaign': self._campaigns[campaign],
+                    'clicks': clicks,
+                    'impressions': impressions,
+                }
+
+    @property
+    def date_created(self) -> date:
+        """
+        date_created of the rows the snapshot was written with.
+        """
+        return datetime.fromisoformat(self.manifest['date_created']).date()
+
+    @property
+    def data_sources(self) -> tuple:
+        return self._data_sources
+
+    @property
+    def campaigns(self) -> tuple:
+        return self._campaigns
@@ -1,48 +1,435 @@
-from datetime import datetime, timedelta
-from io import StringIO
+from contextlib import contextmanager
+import csv
+from datetime import date, datetime, timedelta
+from http.client import IncompleteRead
+import io
+import json
+import logging
+import os
+from queue import Queue
+import threading
+from typing import Iterator, List, Optional, Set, TextIO, Tuple, Union
 from urllib import request
+from urllib.error import HTTPError
+import uuid
 
 from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from django.db.models import DateField, F, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.query import QuerySet
 from django.db.utils import IntegrityError
+from django.utils import timezone
 from django.utils.timezone import make_aware
 
 from .extraction import CSVData
-from .models import Campaign, DataSource, RowData
+from .models import (
+    Campaign, DataSource, IngestBatch, IngestRun, RejectedRow, RowData,
+)
+from .signals import data_stored
+from .snapshot import Snapshot, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Row of RowData written by an ingest, without its date_created nor run:
+# date, data_source_id, campaign_id, clicks and impressions
+IngestRow = Tuple[date, int, int, int, int]
+INGEST_COLUMNS = (
+    'date', 'data_source_id', 'campaign_id', 'clicks', 'impressions',
+    'date_created', 'run_id',
+)
+# Temporary table batches get copied into, see _write_batch
+INGEST_TABLE = 'ingest_batch'
 
 
 def refresh_db() -> None:
     """
     Checks against the database if the data is up-to-date according to
     DATA_REFRESH_DAYS value. In case it is not, then it stores the new data.
+    Interrupted ingest runs get resumed straight away.
     """
+    if _get_interrupted_run() is not None:
+        _store_data()
+        return
+
     time_threshold = make_aware(
         datetime.utcnow() - timedelta(days=settings.DATA_REFRESH_DAYS)
     ).date()
-    try:
-        date_created_latest = RowData.objects.values_list(
-            'date_created', flat=True).latest('id')
-    except RowData.DoesNotExist:
-        date_created_latest = None
+    if settings.DATA_APPEND_ONLY:
+        # Append-only runs keep the date_created of the data they extend
+        date_created_latest = IngestRun.objects.using(
+            DEFAULT_DB_ALIAS,
+        ).filter(
+            date_finished__isnull=False,
+        ).values_list(
+            'date_finished__date', flat=True,
+        ).order_by('-id').first()
+    else:
+        date_created_latest = get_latest_generation(DEFAULT_DB_ALIAS)
 
     if date_created_latest is None or date_created_latest <= time_threshold:
         _store_data()
 
 
-def _get_data(url: str) -> StringIO:
-    stream = request.urlopen(url)
-    content = stream.read().decode('utf-8')
-    content = StringIO(content)
+def get_dataset_version(using: Optional[str] = None) -> str:
+    """
+    Identifies the published data, which changes with every finished
+    ingest run and every row stored without one. Empty string when there
+    is no data yet.
+    """
+    run_id = IngestRun.objects.using(using).filter(
+        date_finished__isnull=False,
+    ).order_by('-date_finished').values_list('id', flat=True).first()
+    row_id = RowData.objects.using(using).filter(
+        run__isnull=True,
+    ).order_by('-id').values_list('id', flat=True).first()
+    if run_id is None and row_id is None:
+        return ''
+    return f'{run_id}:{row_id}'
+
+
+def get_published_rows() -> QuerySet:
+    """
+    RowData readers get to see. The rows of an ingest run are written while
+    it is in progress, and only published, all at once, when it finishes.
+    """
+    return RowData.objects.exclude(
+        run__in=IngestRun.objects.filter(
+            date_finished__isnull=True,
+        ).values('id'),
+    )
+
+
+def latest_generation() -> Coalesce:
+    """
+    date_created of the latest published data, as an expression: the
+    generation of the latest finished run or, when newer, the date_created
+    of the newest row stored without a run.
+    """
+    run_generation = Subquery(
+        IngestRun.objects.filter(
+            date_finished__isnull=False,
+            generation__isnull=False,
+        ).order_by('-date_finished').values('generation')[:1],
+        output_field=DateField(),
+    )
+    row_generation = Subquery(
+        RowData.objects.filter(
+            run__isnull=True,
+        ).order_by('-id').values('date_created')[:1],
+        output_field=DateField(),
+    )
+    # Greatest is null when either one is, except on PostgreSQL
+    return Coalesce(
+        Greatest(run_generation, row_generation),
+        run_generation,
+        row_generation,
+    )
+
+
+def get_latest_generation(using: Optional[str] = None) -> Optional[date]:
+    """
+    Value of latest_generation(), None when there is no data yet.
+    """
+    run_generation = IngestRun.objects.using(using).filter(
+        date_finished__isnull=False,
+        generation__isnull=False,
+    ).order_by('-date_finished').values_list('generation', flat=True).first()
+    row_generation = RowData.objects.using(using).filter(
+        run__isnull=True,
+    ).order_by('-id').values_list('date_created', flat=True).first()
+    generations = [
+        generation for generation in (run_generation, row_generation)
+        if generation is not None
+    ]
+    return max(generations, default=None)
+
+
+def _get_interrupted_run() -> Optional[IngestRun]:
+    """
+    Unfinished run of the feed without progress for INGEST_RESUME_SECONDS,
+    so runs still in progress in other workers are not taken over.
+    """
+    return IngestRun.objects.using(DEFAULT_DB_ALIAS).filter(
+        url=settings.ENDPOINT_URL,
+        date_finished__isnull=True,
+        date_updated__lte=_get_resume_threshold(),
+    ).first()
+
+
+def _get_resume_threshold() -> datetime:
+    return timezone.now() - timedelta(seconds=settings.INGEST_RESUME_SECONDS)
+
+
+def _claim_run() -> Optional[IngestRun]:
+    """
+    Run to store the feed with: its unfinished run when it was interrupted,
+    or a new one. None while another run of the feed is in progress, as
+    there is at most one unfinished run per feed.
+    """
+    run = IngestRun.objects.using(DEFAULT_DB_ALIAS).filter(
+        url=settings.ENDPOINT_URL,
+        date_finished__isnull=True,
+    ).first()
+    if run is None:
+        try:
+            with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                return _create_run()
+        except IntegrityError:
+            # Created by a concurrent request in the meantime
+            return None
+
+    # Taken over only if it is still interrupted, in a single statement so
+    # concurrent requests can not both claim it
+    claimed = IngestRun.objects.using(DEFAULT_DB_ALIAS).filter(
+        pk=run.pk,
+        date_updated__lte=_get_resume_threshold(),
+    ).update(
+        date_updated=timezone.now(),
+    )
+    if not claimed:
+        return None
+    run.refresh_from_db()
+    return run
+
+
+def _release_run(run: IngestRun) -> None:
+    """
+    Marks the run as interrupted, so the next request resumes it.
+    """
+    IngestRun.objects.using(DEFAULT_DB_ALIAS).filter(
+        pk=run.pk,
+    ).update(
+        date_updated=_get_resume_threshold(),
+    )
+
+
+@contextmanager
+def _heartbeat(run: IngestRun) -> Iterator[None]:
+    """
+    Touches the run every INGEST_HEARTBEAT_SECONDS from a thread while the
+    block runs, so its long stages and statements do not get it taken for
+    interrupted by other requests.
+    """
+    stopped = threading.Event()
+
+    def beat() -> None:
+        try:
+            while not stopped.wait(settings.INGEST_HEARTBEAT_SECONDS):
+                try:
+                    IngestRun.objects.using(DEFAULT_DB_ALIAS).filter(
+                        pk=run.pk,
+                        date_finished__isnull=True,
+                    ).update(
+                        date_updated=timezone.now(),
+                    )
+                except Exception:
+                    logger.exception('Could not touch ingest run %s', run.pk)
+        finally:
+            # The thread opens its own connection
+            connection.close()
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def _create_run() -> IngestRun:
+    run = IngestRun(url=settings.ENDPOINT_URL)
+    if settings.DATA_APPEND_ONLY:
+        previous_run = IngestRun.objects.filter(
+            date_finished__isnull=False,
+            url=settings.ENDPOINT_URL,
+        ).order_by('-id').first()
+        if previous_run is not None:
+            run.start_offset = previous_run.end_offset
+            run.header = previous_run.header
+    run.save()
+    return run
+
+
+def _get_spool_path(run: IngestRun) -> str:
+    return os.path.join(settings.DOWNLOAD_DIR, f'ingest-{run.id}.csv')
+
+
+def _get_data(run: IngestRun) -> TextIO:
+    """
+    Downloads the feed of the run into its spool file and returns it opened.
+
+    The download resumes from the bytes already fetched, using a Range
+    request. In append-only runs, only the bytes after the previous run get
+    requested, and the spool file starts with the header of the feed.
+    Fetched bytes are checkpointed in the run every chunk.
+    """
+    path = _get_spool_path(run)
+    prefix = run.header.encode('utf-8') if run.start_offset else b''
+    spool_size = os.path.getsize(path) if os.path.exists(path) else 0
+    if spool_size < len(prefix) + run.bytes_fetched:
+        # The spool file got lost, so the download starts over
+        run.bytes_fetched = 0
+        spool_size = 0
+
+    req = request.Request(run.url)
+    if run.end_offset:
+        req.add_header('Range', f'bytes={run.end_offset}-')
+        if run.bytes_fetched and run.etag:
+            # Only resume if the feed did not change in between
+            req.add_header('If-Range', run.etag)
+
+    try:
+        stream = request.urlopen(req, timeout=settings.INGEST_TIMEOUT)
+    except HTTPError as e:
+        if e.code != 416:
+            raise
+        # Range not satisfiable: nothing was added to the feed
+        stream = None
+
+    if stream is not None and stream.getcode() != 206 and run.end_offset:
+        # The whole feed was returned, so it is restarted from scratch
+        logger.info('Feed %s changed, fetching it again', run.url)
+        run.start_offset = 0
+        run.bytes_fetched = 0
+        run.batches_committed = 0
+        run.generation = None
+        run.header = ''
+        prefix = b''
+
+    with open(path, 'r+b' if spool_size else 'wb') as f:
+        if spool_size:
+            # Drops whatever was written after the latest checkpoint
+            f.truncate(len(prefix) + run.bytes_fetched)
+            f.seek(0, os.SEEK_END)
+        else:
+            f.write(prefix)
+
+        if stream is not None:
+            run.etag = stream.headers.get('ETag', run.etag)
+            received = 0
+            while True:
+                chunk = stream.read(settings.INGEST_CHUNK_SIZE)
+                if not chunk:
+                    break
+                f.write(chunk)
+                f.flush()
+                received += len(chunk)
+                run.bytes_fetched += len(chunk)
+                run.save()
+
+            # Dropped connections just end the stream
+            expected = stream.headers.get('Content-Length')
+            if expected is not None and received < int(expected):
+                raise IncompleteRead(b'', int(expected) - received)
+
+    content = open(path, encoding='utf-8', newline='')
+    if not run.header:
+        run.header = content.readline()
+        run.save(update_fields=['header', 'date_updated'])
+        content.seek(0)
     return content
 
 
 def _store_data() -> None:
     """
-    Retrieves the CSV data and stores it in the database.
+    Retrieves the CSV data and stores it in the database, resuming the
+    interrupted run if any. Nothing is done while another run is in
+    progress. A failed run can be resumed by the next request.
+    """
+    run = _claim_run()
+    if run is None:
+        logger.info('Feed %s already being stored', settings.ENDPOINT_URL)
+        return
+
+    try:
+        with _heartbeat(run):
+            content = _get_data(run)
+            csv_data = CSVData(content)
+            csv_data.process()
+            content.close()
+            _store_csv_data(csv_data, run)
+    except Exception:
+        _release_run(run)
+        raise
+
+
+def _store_csv_data(csv_data: CSVData, run: IngestRun) -> None:
+    """
+    Stores the processed data of the run, finishing it. Its rows, and its
+    snapshot if any, are dated with the generation of the run.
     """
-    content = _get_data(settings.ENDPOINT_URL)
-    csv_data = CSVData(content)
-    csv_data.process()
+    _store_rejected_rows(csv_data, run)
+    generation = _get_generation(run)
+
+    if settings.SNAPSHOT_DIR:
+        if run.start_offset:
+            # The rows would not make up the data set on their own
+            logger.info('No snapshot written for the appended rows')
+        else:
+            path = write_snapshot(settings.SNAPSHOT_DIR, csv_data, generation)
+            logger.info('Snapshot written to %s', path)
+
+    save_data(csv_data, run)
+
+    spool_path = _get_spool_path(run)
+    if os.path.exists(spool_path):
+        os.remove(spool_path)
+    data_stored.send(sender=IngestRun, run=run)
+
 
+def _get_generation(run: IngestRun) -> date:
+    """
+    date_created of the rows of the run, set on its first attempt: today's
+    date, or the one of the current data for the rows appended to it.
+    """
+    if run.generation is None:
+        run.generation = date.today()
+        if run.start_offset:
+            run.generation = get_latest_generation() or run.generation
+        run.save(update_fields=['generation', 'date_updated'])
+    return run.generation
+
+
+def _store_rejected_rows(csv_data: CSVData, run: IngestRun) -> None:
+    """
+    Stores the invalid rows of the run, replacing the ones of a previous
+    attempt of it.
+    """
+    RejectedRow.objects.filter(ingest_run=run).delete()
+    RejectedRow.objects.bulk_create(
+        (
+            RejectedRow(
+                ingest_run=run,
+                line_number=line_number,
+                reason=reason,
+                content=json.dumps(row),
+            )
+            for line_number, reason, row in csv_data.rejected_rows
+        ),
+        batch_size=settings.INGEST_BATCH_SIZE,
+    )
+
+
+def save_data(csv_data: Union[CSVData, Snapshot],
+              run: Optional[IngestRun] = None,
+              workers: Optional[int] = None,
+              generation: Optional[date] = None) -> None:
+    """
+    Stores processed data, either coming from a CSV or from a snapshot, in
+    the database, finishing the run. Without a run, a single-use one is
+    created. Rows get the generation of the run as date_created, or
+    `generation` when the run has none yet, today's date by default.
+
+    Rows are written into RowData in batches of INGEST_BATCH_SIZE, under
+    the run, so readers only see them once it finishes. Each batch is
+    checkpointed in the run, and batches written by a previous attempt of
+    the same run are skipped.
+
+    With more than one worker (INGEST_WORKERS by default), batches are
+    written concurrently over that many connections.
+    """
     # Store data sources
     data_sources = {}
     for data_source_name in csv_data.data_sources:
@@ -57,19 +444,191 @@ def _store_data() -> None:
             name=campaign_name)
         campaigns[campaign_name] = campaign.id
 
-    # Store data rows
-    row_data_list = []
-    for data in csv_data.cleaned_data:
-        data['data_source_id'] = data_sources[data['data_source']]
-        del data['data_source']
-        data['campaign_id'] = campaigns[data['campaign']]
-        del data['campaign']
-        row_data_list.append(RowData(**data))
-
-    # To avoid race conditions of two requests entering at the same time in
-    # this statement, we set a unique_together at database level and we
-    # manage the integrity error in case it arises.
+    single_use = run is None
+    if run is None:
+        run = IngestRun.objects.create(url=f'urn:uuid:{uuid.uuid4()}')
+    if run.generation is None:
+        run.generation = generation or date.today()
+        run.save(update_fields=['generation', 'date_updated'])
+
+    written = IngestBatch.objects.filter(run=run)
+    if not run.batches_committed and written.exists():
+        # Written for a version of the feed that changed since
+        RowData.objects.filter(run=run).delete()
+        written.delete()
+    written_batches = set(written.values_list('index', flat=True))
+
+    if workers is None:
+        workers = settings.INGEST_WORKERS
+    batches = _get_batches(csv_data, data_sources, campaigns, written_batches)
+    try:
+        if workers > 1:
+            rows, skipped = _write_parallel(run, batches, workers)
+        else:
+            rows = skipped = 0
+            for index, batch in batches:
+                rows += len(batch)
+                skipped += _write_batch(run, index, batch)
+        _publish_run(run)
+    except Exception:
+        if single_use:
+            # Nothing can resume it, its rows go with it
+            run.delete()
+        raise
+
+    if skipped:
+        logger.warning('Skipped %d of %d rows, already stored', skipped, rows)
+
+
+def _get_batches(csv_data: Union[CSVData, Snapshot], data_sources: dict,
+                 campaigns: dict,
+                 skip: Set[int]) -> Iterator[Tuple[int, List[IngestRow]]]:
+    """
+    Rows with the ids of their data source and campaign, as plain tuples, in
+    numbered batches of INGEST_BATCH_SIZE, skipping the batches numbered in
+    `skip`.
+    """
+    batch_size = settings.INGEST_BATCH_SIZE
+    batch: List[IngestRow] = []
+    for i, data in enumerate(csv_data.cleaned_data):
+        index = i // batch_size
+        if index in skip:
+            continue
+
+        batch.append((
+            data['date'],
+            data_sources[data['data_source']],
+            campaigns[data['campaign']],
+            data['clicks'],
+            data['impressions'],
+        ))
+
+        if len(batch) == batch_size:
+            yield index, batch
+            batch = []
+
+    if batch:
+        yield index, batch
+
+
+def _write_batch(run: IngestRun, index: int, batch: List[IngestRow]) -> int:
+    """
+    Writes the batch into RowData under the run, checkpointing it in the
+    same transaction, and returns the number of its rows skipped because
+    they were already stored. Rows are sent with COPY on PostgreSQL, without
+    building model instances, and with executemany elsewhere.
+    """
+    table = connection.ops.quote_name(RowData._meta.db_table)
+    columns = ', '.join(
+        connection.ops.quote_name(column) for column in INGEST_COLUMNS
+    )
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # COPY can not skip the rows already stored, so they go
+                # through a temporary table of the connection
+                cursor.execute(
+                    f'CREATE TEMPORARY TABLE IF NOT EXISTS {INGEST_TABLE} '
+                    f'(date date, data_source_id integer, '
+                    f'campaign_id integer, clicks integer, '
+                    f'impressions integer)'
+                )
+                # Not committed yet within an outer transaction
+                cursor.execute(f'TRUNCATE {INGEST_TABLE}')
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    f'COPY {INGEST_TABLE} FROM STDIN WITH (FORMAT csv)',
+                    buffer,
+                )
+                cursor.execute(
+                    f'INSERT INTO {table} ({columns}) '
+                    f'SELECT *, %s, %s FROM {INGEST_TABLE} '
+                    f'ON CONFLICT DO NOTHING',
+                    [run.generation, run.id],
+                )
+            else:
+                placeholders = ', '.join(['%s'] * len(INGEST_COLUMNS))
+                generation = connection.ops.adapt_datefield_value(
+                    run.generation,
+                )
+                cursor.executemany(
+                    f'INSERT INTO {table} ({columns}) '
+                    f'VALUES ({placeholders}) ON CONFLICT DO NOTHING',
+                    [
+                        (
+                            connection.ops.adapt_datefield_value(row[0]),
+                            *row[1:],
+                            generation,
+                            run.id,
+                        )
+                        for row in batch
+                    ],
+                )
+            inserted = cursor.rowcount
+        IngestBatch.objects.create(run=run, index=index)
+        IngestRun.objects.filter(pk=run.pk).update(
+            batches_committed=F('batches_committed') + 1,
+            date_updated=timezone.now(),
+        )
+    return len(batch) - inserted
+
+
+def _write_parallel(run: IngestRun,
+                    batches: Iterator[Tuple[int, List[IngestRow]]],
+                    workers: int) -> Tuple[int, int]:
+    """
+    Writes the batches from `workers` threads, each one over its own
+    connection. Returns the number of rows written and skipped.
+    """
+    # Bounded, so batches are not read faster than they are written
+    queue: Queue = Queue(maxsize=workers * 2)
+    failures: List[Exception] = []
+    skipped: List[int] = []
+
+    def work() -> None:
+        try:
+            for index, batch in iter(queue.get, None):
+                if failures:
+                    continue
+                try:
+                    skipped.append(_write_batch(run, index, batch))
+                except Exception as error:
+                    failures.append(error)
+        finally:
+            # Every thread opens its own connection
+            connection.close()
+
+    threads = [threading.Thread(target=work) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    rows = 0
     try:
-        RowData.objects.bulk_create(row_data_list)
-    except IntegrityError:
-        pass
+        for index, batch in batches:
+            if failures:
+                break
+            rows += len(batch)
+            queue.put((index, batch))
+    finally:
+        for _ in threads:
+            queue.put(None)
+        for thread in threads:
+            thread.join()
+
+    if failures:
+        raise failures[0]
+    return rows, sum(skipped)
+
+
+def _publish_run(run: IngestRun) -> None:
+    """
+    Publishes the rows of the run, all at once, by finishing it.
+    """
+    now = timezone.now()
+    IngestRun.objects.filter(pk=run.pk).update(
+        date_finished=now,
+        date_updated=now,
+    )
+    run.refresh_from_db()
@@ -0,0 +1,29 @@
+from django.test import TestCase
+
+from ..downsampling import lttb
+
+
+class TestLTTB(TestCase):
+    def test_short_series_is_kept(self):
+        x = [0, 1, 2, 3]
+        y = [5, 1, 7, 2]
+        self.assertListEqual(lttb(x, y, 10), [0, 1, 2, 3])
+
+    def test_threshold_is_respected(self):
+        x = list(range(1000))
+        y = [i % 17 for i in x]
+        indexes = lttb(x, y, 100)
+        self.assertEqual(len(indexes), 100)
+        self.assertEqual(indexes[0], 0)
+        self.assertEqual(indexes[-1], 999)
+        self.assertListEqual(indexes, sorted(indexes))
+
+    def test_peaks_are_kept(self):
+        """
+        Ensures that outstanding points survive the downsampling.
+        """
+        x = list(range(100))
+        y = [0] * 100
+        y[42] = 1000
+        indexes = lttb(x, y, 10)
+        self.assertIn(42, indexes)
@@ -3,7 +3,10 @@ from io import StringIO
 
 from django.test import TestCase
 
-from ..extraction import CSVData
+from ..extraction import (
+    CSVData, INVALID_CAMPAIGN, INVALID_CLICKS, INVALID_DATE,
+    INVALID_IMPRESSIONS,
+)
 
 
 class TestCSVData(TestCase):
@@ -97,6 +100,48 @@ Date,Datasource,Campaign,Clicks,Impressions
         )
 
 
+class TestCSVDataRejectedRows(TestCase):
+    def setUp(self) -> None:
+        content = StringIO("""\
+Date,Datasource,Campaign,Clicks,Impressions
+01.01.2019,Facebook Ads,Like Ads,274,1979
+1.1.2019,Facebook Ads,Offer Campaigns,10245,764627
+01.01.2019,Google Adwords,,7,444
+01.01.2019,Google Adwords,GDN Prio 1 Offer,many,12535
+01.01.2019,Google Adwords,GDN Prio 2 Offer,93,
+02.01.2019,Google Analytics,Like Ads,1A,51
+""")
+        self.csv_data = CSVData(content)
+
+    def test_rejected_rows(self):
+        self.csv_data.process()
+        self.assertEqual(len(self.csv_data.cleaned_data), 1)
+        self.assertDictEqual(self.csv_data.rejected_counts, {
+            INVALID_DATE: 1,
+            INVALID_CAMPAIGN: 1,
+            INVALID_CLICKS: 2,
+            INVALID_IMPRESSIONS: 1,
+        })
+
+        line_number, reason, row = self.csv_data.rejected_rows[0]
+        self.assertEqual(line_number, 3)
+        self.assertEqual(reason, INVALID_DATE)
+        self.assertEqual(row['Date'], '1.1.2019')
+
+    def test_bounded_logging(self):
+        """
+        Ensures that just a sample of the rejected rows is logged, plus a
+        summary.
+        """
+        self.csv_data.rejected_log_limit = 2
+        with self.assertLogs('app.extraction', level='DEBUG') as logs:
+            self.csv_data.process()
+
+        self.assertEqual(len(logs.records), 3)
+        self.assertEqual(logs.records[-1].levelname, 'WARNING')
+        self.assertIn('Skipped 5 invalid rows', logs.output[-1])
+
+
 class TestCSVDataIsValidData(TestCase):
     def setUp(self) -> None:
         self.row = {
@@ -150,3 +195,22 @@ class TestCSVDataIsValidData(TestCase):
 
         self.row['Impressions'] = '1A'
         self.assertFalse(CSVData._is_valid_data(self.row))
+
+    def test_missing_values_dont_validate(self):
+        """
+        Ensures that short rows, with None values, are rejected.
+        """
+        self.row['Date'] = None
+        self.assertFalse(CSVData._is_valid_data(self.row))
+
+        self.row['Date'] = '31.10.2019'
+        self.row['Impressions'] = None
+        self.assertFalse(CSVData._is_valid_data(self.row))
+
+    def test_rejection_reason(self):
+        self.assertIsNone(CSVData._get_rejection_reason(self.row))
+
+        self.row['Campaign'] = ''
+        self.assertEqual(
+            CSVData._get_rejection_reason(self.row), INVALID_CAMPAIGN
+        )
@@ -0,0 +1,69 @@
+import gzip
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+
+from ..middleware import CachedGZipMiddleware
+
+
+class TestCachedGZipMiddleware(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.content = b'Clicks and impressions. ' * 100
+        self.middleware = CachedGZipMiddleware()
+        self.request = RequestFactory().get(
+            '/', HTTP_ACCEPT_ENCODING='gzip, deflate'
+        )
+
+    def get_response(self, etag=None):
+        response = HttpResponse(self.content)
+        if etag:
+            response['ETag'] = etag
+        return self.middleware.process_response(self.request, response)
+
+    def test_compresses(self):
+        response = self.get_response('"version"')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], 'W/"version"')
+        self.assertEqual(gzip.decompress(response.content), self.content)
+
+    def test_reuses_compressed_content(self):
+        """
+        Ensures that a response with a known ETag gets the cached compressed
+        content instead of compressing it again.
+        """
+        self.get_response('"version"')
+        cache.set('gzip:/:"version"', b'cached')
+
+        response = self.get_response('"version"')
+        self.assertEqual(response.content, b'cached')
+        self.assertEqual(response['Content-Length'], '6')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], 'W/"version"')
+
+    def test_cached_per_path(self):
+        """
+        Ensures that responses of different paths with the same ETag do not
+        share their compressed content.
+        """
+        self.get_response('"version"')
+        self.content = b'Campaigns and data sources. ' * 100
+        self.request = RequestFactory().get(
+            '/data/', HTTP_ACCEPT_ENCODING='gzip, deflate'
+        )
+
+        response = self.get_response('"version"')
+        self.assertEqual(gzip.decompress(response.content), self.content)
+
+    def test_without_etag_is_not_cached(self):
+        response = self.get_response()
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIsNone(cache.get('gzip:/:None'))
+
+    def test_not_accepted_encoding(self):
+        self.request = RequestFactory().get('/')
+        response = self.get_response('"version"')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, self.content)
+        self.assertIsNone(cache.get('gzip:/:"version"'))
@@ -0,0 +1,72 @@
+from io import StringIO
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from .. import warming
+from ..models import IngestRun, RowData
+from ..signals import data_stored
+
+
+@override_settings(SNAPSHOT_DIR=None)
+class TestProfileMemoryCommand(TestCase):
+    content = (
+        'Date,Datasource,Campaign,Clicks,Impressions\n'
+        '01.01.2019,Facebook Ads,Like Ads,274,1979\n'
+        '01.01.2019,Google Adwords,Like Ads,7,444\n'
+        '02.01.2019,Google Analytics,POL Desktop,5,1103\n'
+    )
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.csv')
+        self.addCleanup(os.remove, self.path)
+        with os.fdopen(fd, 'w') as f:
+            f.write(self.content)
+
+    def test_report(self):
+        """
+        Ensures that the whole pipeline runs on the file, reporting the
+        allocations of every stage as JSON.
+        """
+        stdout = StringIO()
+        with mock.patch.object(warming.executor, 'submit') as submit:
+            call_command(
+                'profile_memory', self.path, '--top', '3',
+                '--query', 'granularity=week', stdout=stdout,
+            )
+            submit.assert_not_called()
+        report = json.loads(stdout.getvalue())
+
+        self.assertEqual(report['rows'], 3)
+        self.assertEqual(
+            [stage['name'] for stage in report['stages']],
+            ['get_data', 'process', 'store_data', 'render'],
+        )
+        for stage in report['stages']:
+            self.assertGreater(stage['peak'], 0)
+            self.assertGreaterEqual(stage['peak'], stage['retained'])
+            self.assertLessEqual(len(stage['top']), 3)
+        self.assertTrue(any(
+            site['traceback'][0].startswith('app' + os.sep)
+            for stage in report['stages'] for site in stage['top']
+        ))
+
+        # Rolled back, and warming connected again
+        self.assertFalse(RowData.objects.exists())
+        self.assertFalse(IngestRun.objects.exists())
+        self.assertTrue(data_stored.has_listeners())
+
+    def test_commit(self):
+        """
+        Ensures that the rows are kept as the latest data with --commit.
+        """
+        call_command(
+            'profile_memory', self.path, '--commit', stdout=StringIO(),
+        )
+
+        self.assertEqual(RowData.objects.count(), 3)
+        self.assertIsNotNone(IngestRun.objects.get().date_finished)
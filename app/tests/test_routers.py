@@ -0,0 +1,74 @@
+from unittest import mock
+
+from django.db import router
+from django.test import TestCase, override_settings
+
+from ..models import RowData
+from ..routers import replica_reads
+
+
+class TestReplicaRouter(TestCase):
+    """
+    In tests, the replica mirrors the default database through another
+    connection, which does not see the data of the running test. So the
+    dataset versions get mocked.
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.versions = {'default': '1', 'replica': '1'}
+        patcher = mock.patch(
+            'app.routers.get_dataset_version',
+            side_effect=lambda using: self.versions[using],
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_without_replica(self):
+        with replica_reads() as alias:
+            self.assertEqual(alias, 'default')
+            self.assertEqual(router.db_for_read(RowData), 'default')
+
+    @override_settings(DATABASE_REPLICA='replica')
+    def test_reads_from_replica(self):
+        """
+        Ensures that reads inside the block, and only those, go to the
+        replica, while writes stay in the primary.
+        """
+        self.assertEqual(RowData.objects.all().db, 'default')
+
+        with replica_reads() as alias:
+            self.assertEqual(alias, 'replica')
+            self.assertEqual(RowData.objects.all().db, 'replica')
+            self.assertEqual(router.db_for_write(RowData), 'default')
+
+        self.assertEqual(RowData.objects.all().db, 'default')
+
+    @override_settings(DATABASE_REPLICA='replica')
+    def test_lagging_replica(self):
+        """
+        Ensures that reads stay in the primary while the replica does not
+        have the latest data.
+        """
+        self.versions['default'] = '2'
+        with replica_reads() as alias:
+            self.assertEqual(alias, 'default')
+            self.assertEqual(RowData.objects.all().db, 'default')
+
+        self.versions['replica'] = '2'
+        with replica_reads() as alias:
+            self.assertEqual(alias, 'replica')
+
+    @override_settings(DATABASE_REPLICA='replica')
+    @mock.patch('app.views.refresh_db')
+    def test_dashboard_reads_from_replica(self, _mock_refresh_db):
+        with mock.patch('app.views.IndexView._get_facets') as mock_facets:
+            mock_facets.side_effect = (
+                lambda filters: self.assertEqual(
+                    router.db_for_read(RowData), 'replica',
+                ) or ([], [])
+            )
+            response = self.client.get('/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(mock_facets.called)
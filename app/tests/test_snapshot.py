@@ -0,0 +1,86 @@
+from datetime import date
+from io import StringIO
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..extraction import CSVData
+from ..models import RowData
+from ..snapshot import Snapshot, write_snapshot
+
+
+class TestSnapshot(TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        content = StringIO("""\
+Date,Datasource,Campaign,Clicks,Impressions
+01.01.2019,Facebook Ads,Like Ads,274,1979
+01.01.2019,Google Adwords,Like Ads,7,444
+02.01.2019,Google Adwords,GDN Prio 1 Offer,16,12535
+        """)
+        self.csv_data = CSVData(content)
+        self.csv_data.process()
+
+    def test_write_and_read(self):
+        """
+        Ensures that a snapshot gives back the data it was written with.
+        """
+        path = write_snapshot(
+            self.directory, self.csv_data, date(2019, 10, 18),
+        )
+        self.assertEqual(os.listdir(self.directory), [os.path.basename(path)])
+
+        snapshot = Snapshot(path, chunk_size=2)
+        self.assertEqual(snapshot.manifest['rows'], 3)
+        self.assertEqual(snapshot.data_sources, self.csv_data.data_sources)
+        self.assertEqual(snapshot.campaigns, self.csv_data.campaigns)
+        self.assertListEqual(
+            list(snapshot.cleaned_data), self.csv_data.cleaned_data
+        )
+
+    def test_columns_are_memory_mapped(self):
+        path = write_snapshot(
+            self.directory, self.csv_data, date(2019, 10, 18),
+        )
+        snapshot = Snapshot(path)
+        self.assertIsInstance(snapshot.columns['clicks'], np.memmap)
+        self.assertListEqual(
+            snapshot.columns['clicks'].tolist(), [274, 7, 16]
+        )
+        with self.assertRaises(ValueError):
+            snapshot.columns['clicks'][0] = 1
+
+    def test_load_snapshot_command(self):
+        path = write_snapshot(
+            self.directory, self.csv_data, date(2019, 10, 18),
+        )
+        with open(os.path.join(path, 'manifest.json')) as f:
+            self.assertEqual(json.load(f)['date_created'], '2019-10-18')
+
+        stdout = StringIO()
+        call_command('load_snapshot', path, stdout=stdout)
+
+        self.assertIn('Stored 3 rows', stdout.getvalue())
+        self.assertEqual(RowData.objects.count(), 3)
+        self.assertEqual(
+            RowData.objects.filter(
+                data_source__name='Google Adwords',
+                campaign__name='GDN Prio 1 Offer',
+                clicks=16,
+                impressions=12535,
+            ).count(),
+            1,
+        )
+        # The snapshot's own date, not the day it got loaded
+        self.assertEqual(
+            set(RowData.objects.values_list('date_created', flat=True)),
+            {date(2019, 10, 18)},
+        )
@@ -1,13 +1,31 @@
 import copy
 from datetime import date, datetime, timedelta
+from http.client import IncompleteRead
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import os
+import shutil
+import socket
+import tempfile
+from threading import Thread
+import time
 from unittest import mock
 
 from django.conf import settings
-from django.test import TestCase
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
 
 from ..extraction import CSVData
-from ..models import Campaign, DataSource, RowData
-from ..storage import refresh_db, _store_data
+from ..models import (
+    Campaign, DataSource, IngestBatch, IngestRun, RejectedRow, RowData,
+)
+from ..snapshot import Snapshot
+from ..storage import (
+    get_dataset_version, get_latest_generation, get_published_rows,
+    refresh_db, save_data, _claim_run, _get_interrupted_run, _heartbeat,
+    _store_data, _write_batch,
+)
 from .factories import RowDataF
 
 
@@ -48,6 +66,45 @@ class TestRefreshDB(TestCase):
         mock_store_data.assert_called_once_with()
 
 
+class TestGetDatasetVersion(TestCase):
+    def test_empty_db(self):
+        self.assertEqual(get_dataset_version(), '')
+
+    def test_changes_with_new_data(self):
+        RowDataF()
+        version = get_dataset_version()
+        self.assertNotEqual(version, '')
+
+        RowDataF(date=date(2019, 1, 1))
+        self.assertNotEqual(get_dataset_version(), version)
+
+    def test_changes_with_finished_runs(self):
+        """
+        Ensures that the rows of a run change the version, and get
+        published, only once it finishes.
+        """
+        RowDataF()
+        version = get_dataset_version()
+        run = IngestRun.objects.create(
+            url='http://localhost/feed.csv', generation=date(2019, 10, 18),
+        )
+        RowDataF(run=run)
+        self.assertEqual(get_dataset_version(), version)
+        self.assertEqual(get_published_rows().count(), 1)
+        self.assertEqual(get_latest_generation(), date.today())
+
+        run.date_finished = timezone.now()
+        run.save()
+        self.assertNotEqual(get_dataset_version(), version)
+        self.assertEqual(get_published_rows().count(), 2)
+        self.assertEqual(get_latest_generation(), date.today())
+
+        RowData.objects.filter(run=None).update(
+            date_created=date(2019, 10, 17),
+        )
+        self.assertEqual(get_latest_generation(), date(2019, 10, 18))
+
+
 class TestStoreData(TestCase):
     @mock.patch('app.storage._get_data')
     @mock.patch('app.storage.CSVData')
@@ -97,3 +154,432 @@ class TestStoreData(TestCase):
             self.assertEqual(
                 row_data.impressions, cleaned_data[i]['impressions']
             )
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves `content` supporting Range and If-Range requests. With
+    `fail_after`, the connection gets dropped after sending that many bytes.
+    With `stall`, the connection gets dropped after that many seconds
+    without a response.
+    """
+    content = b''
+    etag = ''
+    fail_after = None
+    stall = None
+    ranges: list = []
+
+    def do_GET(self):
+        range_header = self.headers.get('Range')
+        self.ranges.append(range_header)
+        if self.stall is not None:
+            time.sleep(self.stall)
+            return
+
+        start = 0
+        if_range = self.headers.get('If-Range')
+        if range_header and if_range in (None, self.etag):
+            start = int(range_header[len('bytes='):-len('-')])
+            if start >= len(self.content):
+                self.send_response(416)
+                self.end_headers()
+                return
+
+        body = self.content[start:]
+        self.send_response(206 if start else 200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', self.etag)
+        if start:
+            self.send_header(
+                'Content-Range',
+                f'bytes {start}-{len(self.content) - 1}/{len(self.content)}',
+            )
+        self.end_headers()
+
+        if self.fail_after is not None:
+            body = body[:self.fail_after]
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestStoreDataDownload(TestCase):
+    content = (
+        b'Date,Datasource,Campaign,Clicks,Impressions\n'
+        b'01.01.2019,Facebook Ads,Like Ads,274,1979\n'
+        b'01.01.2019,Facebook Ads,Offer Campaigns,10245,764627\n'
+        b'01.01.2019,Google Adwords,Like Ads,7,444\n'
+        b'02.01.2019,Google Analytics,Like Ads,7,51\n'
+        b'02.01.2019,Google Analytics,POL Desktop,5,1103\n'
+    )
+
+    def setUp(self):
+        self.handler = type('Handler', (RangeRequestHandler,), {
+            'content': self.content,
+            'etag': '"1"',
+            'ranges': [],
+        })
+        server = HTTPServer(('127.0.0.1', 0), self.handler)
+        Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        download_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, download_dir)
+
+        overridden_settings = override_settings(
+            ENDPOINT_URL=f'http://127.0.0.1:{server.server_port}/feed.csv',
+            DOWNLOAD_DIR=download_dir,
+            INGEST_CHUNK_SIZE=16,
+            INGEST_BATCH_SIZE=2,
+            SNAPSHOT_DIR=None,
+        )
+        overridden_settings.enable()
+        self.addCleanup(overridden_settings.disable)
+
+    @staticmethod
+    def interrupt_runs():
+        IngestRun.objects.update(
+            date_updated=datetime.utcnow() - timedelta(days=1),
+        )
+
+    def test_store_data(self):
+        _store_data()
+        self.assertEqual(RowData.objects.count(), 5)
+
+        run = IngestRun.objects.get()
+        self.assertIsNotNone(run.date_finished)
+        self.assertEqual(run.bytes_fetched, len(self.content))
+        self.assertEqual(run.batches_committed, 3)
+        self.assertEqual(run.etag, '"1"')
+        self.assertEqual(
+            run.header, 'Date,Datasource,Campaign,Clicks,Impressions\n'
+        )
+        self.assertEqual(os.listdir(settings.DOWNLOAD_DIR), [])
+
+    def test_rejected_rows(self):
+        """
+        Ensures that invalid rows are stored for the run, once even if the
+        run is resumed.
+        """
+        self.handler.content = self.content + (
+            b'03.01.2019,Google Analytics,POL Desktop,many,1200\n'
+        )
+        with mock.patch('app.storage.save_data', side_effect=ConnectionError):
+            with self.assertRaises(ConnectionError):
+                _store_data()
+        self.interrupt_runs()
+        _store_data()
+
+        rejected_row = RejectedRow.objects.get()
+        self.assertEqual(rejected_row.ingest_run, IngestRun.objects.get())
+        self.assertEqual(rejected_row.line_number, 7)
+        self.assertEqual(rejected_row.reason, 'invalid_clicks')
+        self.assertEqual(json.loads(rejected_row.content)['Clicks'], 'many')
+
+    def test_resume_download(self):
+        """
+        Ensures that an interrupted download resumes from the latest
+        checkpoint with a Range request.
+        """
+        self.handler.fail_after = 100
+        with self.assertRaises(IncompleteRead):
+            _store_data()
+
+        run = IngestRun.objects.get()
+        self.assertIsNone(run.date_finished)
+        self.assertEqual(run.bytes_fetched, 100)
+        self.assertEqual(RowData.objects.count(), 0)
+
+        self.handler.fail_after = None
+        self.interrupt_runs()
+        refresh_db()
+
+        self.assertEqual(self.handler.ranges, [None, 'bytes=100-'])
+        self.assertEqual(RowData.objects.count(), 5)
+        run.refresh_from_db()
+        self.assertIsNotNone(run.date_finished)
+        self.assertEqual(run.bytes_fetched, len(self.content))
+
+    @override_settings(INGEST_TIMEOUT=0.05)
+    def test_download_timeout(self):
+        """
+        Ensures that a stalled download fails, leaving the run to be resumed.
+        """
+        self.handler.stall = 0.5
+        with self.assertRaises(socket.timeout):
+            _store_data()
+
+        run = IngestRun.objects.get()
+        self.assertIsNone(run.date_finished)
+        self.assertIsNotNone(_get_interrupted_run())
+
+    def test_resume_changed_feed(self):
+        """
+        Ensures that the download starts over when the feed changed since
+        the interrupted download.
+        """
+        self.handler.fail_after = 100
+        with self.assertRaises(IncompleteRead):
+            _store_data()
+
+        self.handler.fail_after = None
+        self.handler.etag = '"2"'
+        self.interrupt_runs()
+        _store_data()
+
+        self.assertEqual(self.handler.ranges, [None, 'bytes=100-'])
+        self.assertEqual(RowData.objects.count(), 5)
+        self.assertEqual(
+            IngestRun.objects.get().bytes_fetched, len(self.content)
+        )
+
+    def test_resume_batches(self):
+        """
+        Ensures that written batches stay invisible until the run finishes,
+        and that they are not written again when it is resumed.
+        """
+        calls = []
+
+        def write_batch(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise ConnectionError
+            return _write_batch(*args)
+
+        with mock.patch('app.storage._write_batch', side_effect=write_batch):
+            with self.assertRaises(ConnectionError):
+                _store_data()
+        self.assertEqual(RowData.objects.count(), 2)
+        self.assertFalse(get_published_rows().exists())
+        self.assertEqual(IngestBatch.objects.count(), 1)
+        self.assertEqual(IngestRun.objects.get().batches_committed, 1)
+
+        with mock.patch('app.storage._write_batch', side_effect=write_batch):
+            _store_data()
+
+        # Resumed run: two remaining batches, without downloading again
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(
+            self.handler.ranges, [None, f'bytes={len(self.content)}-']
+        )
+        self.assertEqual(get_published_rows().count(), 5)
+        run = IngestRun.objects.get()
+        self.assertEqual(run.batches_committed, 3)
+        self.assertIsNotNone(run.date_finished)
+
+    def test_failed_run_keeps_data(self):
+        """
+        Ensures that a run failing halfway does not replace the previous
+        data with part of the new one.
+        """
+        _store_data()
+        previous = date(2019, 10, 18)
+        RowData.objects.update(date_created=previous)
+        IngestRun.objects.update(generation=previous)
+
+        self.handler.content = self.content.replace(b'274', b'275')
+        self.handler.etag = '"2"'
+        with mock.patch(
+            'app.storage._write_batch',
+            side_effect=[0, ConnectionError],
+        ):
+            with self.assertRaises(ConnectionError):
+                _store_data()
+
+        self.assertEqual(get_latest_generation(), previous)
+        self.assertEqual(get_published_rows().count(), 5)
+        self.assertEqual(
+            get_published_rows().filter(date_created=previous).count(), 5
+        )
+
+    def test_resume_failed_run_straight_away(self):
+        """
+        Ensures that the next run after a failure resumes the failed one.
+        """
+        self.handler.fail_after = 100
+        with self.assertRaises(IncompleteRead):
+            _store_data()
+
+        self.handler.fail_after = None
+        _store_data()
+
+        self.assertEqual(self.handler.ranges, [None, 'bytes=100-'])
+        run = IngestRun.objects.get()
+        self.assertIsNotNone(run.date_finished)
+        self.assertEqual(RowData.objects.count(), 5)
+
+    def test_run_in_progress(self):
+        """
+        Ensures that no run starts while another one is in progress.
+        """
+        IngestRun.objects.create(url=settings.ENDPOINT_URL)
+
+        _store_data()
+        refresh_db()
+
+        self.assertEqual(self.handler.ranges, [])
+        self.assertEqual(IngestRun.objects.count(), 1)
+        self.assertEqual(RowData.objects.count(), 0)
+
+    @override_settings(DATA_APPEND_ONLY=True)
+    def test_append_only(self):
+        """
+        Ensures that only the bytes added to the feed are fetched, and that
+        their rows join the current data.
+        """
+        _store_data()
+        generation = date(2019, 10, 18)
+        RowData.objects.update(date_created=generation)
+        IngestRun.objects.update(generation=generation)
+
+        self.handler.content = self.content + (
+            b'03.01.2019,Google Analytics,POL Desktop,7,1200\n'
+        )
+        self.handler.etag = '"2"'
+        _store_data()
+
+        # Nothing else was added
+        _store_data()
+
+        self.assertEqual(self.handler.ranges, [
+            None,
+            f'bytes={len(self.content)}-',
+            f'bytes={len(self.handler.content)}-',
+        ])
+        self.assertEqual(RowData.objects.count(), 6)
+        self.assertEqual(
+            RowData.objects.filter(date_created=generation).count(), 6
+        )
+        runs = IngestRun.objects.order_by('id')
+        self.assertEqual(
+            [run.end_offset for run in runs],
+            [len(self.content), len(self.handler.content),
+             len(self.handler.content)],
+        )
+
+    @override_settings(DATA_APPEND_ONLY=True)
+    def test_snapshots(self):
+        """
+        Ensures that snapshots get the date_created of the rows, and that
+        the rows appended by a run get none, not being the whole data.
+        """
+        snapshot_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, snapshot_dir)
+        with override_settings(SNAPSHOT_DIR=snapshot_dir):
+            _store_data()
+            self.handler.content = self.content + (
+                b'03.01.2019,Google Analytics,POL Desktop,7,1200\n'
+            )
+            self.handler.etag = '"2"'
+            _store_data()
+
+        self.assertEqual(IngestRun.objects.count(), 2)
+        name, = os.listdir(snapshot_dir)
+        snapshot = Snapshot(os.path.join(snapshot_dir, name))
+        self.assertEqual(snapshot.manifest['rows'], 5)
+        self.assertEqual(
+            set(RowData.objects.values_list('date_created', flat=True)),
+            {snapshot.date_created},
+        )
+
+
+class TestHeartbeat(TransactionTestCase):
+    """
+    The run gets touched from another thread, over its own connection, so
+    it has to be committed for the thread to see it.
+    """
+    @override_settings(INGEST_HEARTBEAT_SECONDS=0.01)
+    def test_touches_run(self):
+        """
+        Ensures that a run in progress keeps getting touched, so it is not
+        claimed by other requests, and is no longer once the block ends.
+        """
+        IngestRun.objects.create(url=settings.ENDPOINT_URL)
+        IngestRun.objects.update(
+            date_updated=datetime.utcnow() - timedelta(days=1),
+        )
+        run = IngestRun.objects.get()
+        with _heartbeat(run):
+            time.sleep(0.2)
+            self.assertIsNone(_claim_run())
+
+        run.refresh_from_db()
+        date_updated = run.date_updated
+        self.assertGreater(
+            date_updated, timezone.now() - timedelta(seconds=1),
+        )
+        time.sleep(0.05)
+        run.refresh_from_db()
+        self.assertEqual(run.date_updated, date_updated)
+
+
+@override_settings(INGEST_BATCH_SIZE=2)
+class TestSaveDataParallel(TransactionTestCase):
+    """
+    Workers write over their own connections, so the data has to be
+    committed for them to see it.
+    """
+    content = TestStoreDataDownload.content.decode()
+
+    def get_csv_data(self) -> CSVData:
+        csv_data = CSVData(self.content.splitlines(keepends=True))
+        csv_data.process()
+        return csv_data
+
+    @staticmethod
+    def get_rows(qs: QuerySet) -> list:
+        return list(qs.values_list(
+            'date', 'data_source__name', 'campaign__name', 'clicks',
+            'impressions',
+        ).order_by('id'))
+
+    def test_save_data(self):
+        """
+        Ensures that the rows get published as the serial ingest stores
+        them.
+        """
+        run = IngestRun.objects.create(url='http://localhost/feed.csv')
+        save_data(self.get_csv_data(), run, workers=3)
+
+        parallel_rows = self.get_rows(RowData.objects.all())
+        self.assertEqual(len(parallel_rows), 5)
+        self.assertEqual(
+            set(RowData.objects.values_list('date_created', flat=True)),
+            {date.today()},
+        )
+        run.refresh_from_db()
+        self.assertEqual(run.batches_committed, 3)
+
+        # Stored again, rows already there are skipped
+        with self.assertLogs('app.storage', 'WARNING') as logs:
+            save_data(self.get_csv_data(), workers=3)
+        self.assertEqual(RowData.objects.count(), 5)
+        self.assertIn('Skipped 5 of 5 rows', logs.output[0])
+
+        RowData.objects.all().delete()
+        save_data(self.get_csv_data(), workers=1)
+        self.assertCountEqual(
+            self.get_rows(RowData.objects.all()), parallel_rows,
+        )
+
+    def test_failed_worker(self):
+        """
+        Ensures that nothing gets published when a worker fails, and that
+        the rows written are removed with their single-use run.
+        """
+        calls = []
+
+        def fail_second(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise ConnectionError
+            return _write_batch(*args)
+
+        with mock.patch('app.storage._write_batch', side_effect=fail_second):
+            with self.assertRaises(ConnectionError):
+                save_data(self.get_csv_data(), workers=2)
+
+        self.assertFalse(RowData.objects.exists())
+        self.assertFalse(IngestRun.objects.exists())
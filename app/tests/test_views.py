@@ -1,9 +1,18 @@
-from datetime import datetime
+from datetime import date, datetime, timedelta
+import gzip
+import json
+from unittest import mock
 
-from django.test import TestCase
+import plotly.graph_objs as go
 
-from ..views import IndexView
-from .factories import RowDataF
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F, Sum
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from ..views import GRANULARITIES, IndexView, METRICS
+from .factories import CampaignF, DataSourceF, RowDataF
 
 
 class TestIndexView(TestCase):
@@ -21,7 +30,7 @@ class TestIndexView(TestCase):
         qs = IndexView._get_filtered_data({})
 
         self.assertEqual(qs.count(), 1)
-        self.assertEqual(qs[0]['date'], datetime(2019, 10, 18).date())
+        self.assertEqual(qs[0]['period'], datetime(2019, 10, 18).date())
         self.assertEqual(qs[0]['clicks_total'], 2)
         self.assertEqual(qs[0]['impressions_total'], 20)
 
@@ -39,7 +48,7 @@ class TestIndexView(TestCase):
             'data_sources': ['DataSource ńámë'],
         })
         self.assertEqual(qs.count(), 1)
-        self.assertEqual(qs[0]['date'], datetime(2019, 10, 18).date())
+        self.assertEqual(qs[0]['period'], datetime(2019, 10, 18).date())
         self.assertEqual(qs[0]['clicks_total'], 2)
         self.assertEqual(qs[0]['impressions_total'], 20)
 
@@ -53,10 +62,10 @@ class TestIndexView(TestCase):
             'data_sources': ['DataSource ńámë', 'Extra Source'],
         })
         self.assertEqual(qs.count(), 2)
-        self.assertEqual(qs[0]['date'], datetime(2019, 5, 10).date())
+        self.assertEqual(qs[0]['period'], datetime(2019, 5, 10).date())
         self.assertEqual(qs[0]['clicks_total'], 1)
         self.assertEqual(qs[0]['impressions_total'], 10)
-        self.assertEqual(qs[1]['date'], datetime(2019, 10, 18).date())
+        self.assertEqual(qs[1]['period'], datetime(2019, 10, 18).date())
         self.assertEqual(qs[1]['clicks_total'], 2)
         self.assertEqual(qs[1]['impressions_total'], 20)
 
@@ -74,7 +83,7 @@ class TestIndexView(TestCase):
             'campaigns': ['Campaign ńámë'],
         })
         self.assertEqual(qs.count(), 1)
-        self.assertEqual(qs[0]['date'], datetime(2019, 10, 18).date())
+        self.assertEqual(qs[0]['period'], datetime(2019, 10, 18).date())
         self.assertEqual(qs[0]['clicks_total'], 2)
         self.assertEqual(qs[0]['impressions_total'], 20)
 
@@ -92,19 +101,725 @@ class TestIndexView(TestCase):
             'campaigns': ['Campaign ńámë'],
         })
         self.assertEqual(qs.count(), 1)
-        self.assertEqual(qs[0]['date'], datetime(2019, 10, 18).date())
+        self.assertEqual(qs[0]['period'], datetime(2019, 10, 18).date())
         self.assertEqual(qs[0]['clicks_total'], 2)
         self.assertEqual(qs[0]['impressions_total'], 20)
 
+    def test_get_filtered_data_date_range(self):
+        """
+        Ensures data gets filtered by a date range, both ends included.
+        """
+        RowDataF(date=date(2019, 1, 1))
+        RowDataF(date=date(2019, 1, 2), clicks=2)
+        RowDataF(date=date(2019, 1, 3))
+        qs = IndexView._get_filtered_data({
+            'date_from': date(2019, 1, 2),
+            'date_to': date(2019, 1, 3),
+        })
+        self.assertEqual(qs.count(), 2)
+        self.assertEqual(qs[0]['period'], date(2019, 1, 2))
+        self.assertEqual(qs[0]['clicks_total'], 2)
+        self.assertEqual(qs[1]['period'], date(2019, 1, 3))
+
+    def test_get_filtered_data_granularity(self):
+        """
+        Ensures data gets grouped by week and month.
+        """
+        RowDataF(date=date(2019, 1, 30))  # Wednesday
+        RowDataF(date=date(2019, 2, 1), clicks=2)  # Friday
+        RowDataF(date=date(2019, 2, 4), clicks=4)  # Monday
+
+        qs = IndexView._get_filtered_data({'granularity': 'week'})
+        self.assertEqual(qs.count(), 2)
+        self.assertEqual(qs[0]['period'], date(2019, 1, 28))
+        self.assertEqual(qs[0]['clicks_total'], 3)
+        self.assertEqual(qs[1]['period'], date(2019, 2, 4))
+        self.assertEqual(qs[1]['clicks_total'], 4)
+
+        qs = IndexView._get_filtered_data({'granularity': 'month'})
+        self.assertEqual(qs.count(), 2)
+        self.assertEqual(qs[0]['period'], date(2019, 1, 1))
+        self.assertEqual(qs[0]['clicks_total'], 1)
+        self.assertEqual(qs[1]['period'], date(2019, 2, 1))
+        self.assertEqual(qs[1]['clicks_total'], 6)
+
+    def test_get_filtered_data_metrics(self):
+        """
+        Ensures derived metrics are computed over the grouped periods.
+        """
+        RowDataF(date=date(2019, 1, 1), clicks=1, impressions=10)
+        RowDataF(date=date(2019, 1, 2), clicks=2, impressions=0)
+        RowDataF(date=date(2019, 1, 3), clicks=3, impressions=10)
+        RowDataF(date=date(2019, 1, 3), clicks=3, impressions=30)
+
+        qs = IndexView._get_filtered_data({
+            'metrics': list(METRICS),
+            'window': 2,
+        })
+        self.assertListEqual(
+            [obj['ctr'] for obj in qs], [0.1, None, 0.15],
+        )
+        self.assertListEqual(
+            [obj['clicks_cumulative'] for obj in qs], [1, 3, 9],
+        )
+        self.assertListEqual(
+            [obj['impressions_cumulative'] for obj in qs], [10, 10, 50],
+        )
+        self.assertListEqual(
+            [obj['clicks_moving_average'] for obj in qs], [0.5, 1.5, 4.0],
+        )
+        self.assertListEqual(
+            [obj['impressions_moving_average'] for obj in qs],
+            [5.0, 5.0, 20.0],
+        )
+
+    def test_get_filtered_data_moving_average_gaps(self):
+        """
+        Ensures moving averages span periods, not grouped rows, so periods
+        without rows count as zero.
+        """
+        RowDataF(date=date(2019, 1, 1), clicks=4)
+        RowDataF(date=date(2019, 1, 3), clicks=2)
+        RowDataF(date=date(2019, 1, 7), clicks=6)
+        RowDataF(date=date(2019, 2, 20), clicks=8)
+
+        filters = {'metrics': ['clicks_moving_average'], 'window': 3}
+        qs = IndexView._get_filtered_data(filters)
+        self.assertListEqual(
+            [obj['clicks_moving_average'] for obj in qs],
+            [4 / 3, 2.0, 2.0, 8 / 3],
+        )
+
+        filters['granularity'] = 'week'
+        qs = IndexView._get_filtered_data(filters)
+        self.assertListEqual(
+            [obj['clicks_moving_average'] for obj in qs], [2.0, 4.0, 8 / 3],
+        )
+
+
+class TestGetFilters(TestCase):
+    def get_filters(self, query_string: str) -> dict:
+        view = IndexView()
+        view.request = RequestFactory().get('/?' + query_string)
+        return view.get_filters()
+
+    def test_empty(self):
+        self.assertDictEqual(self.get_filters(''), {})
+
+    def test_filters(self):
+        filters = self.get_filters(
+            'data-sources=A&data-sources=B&campaigns=C'
+            '&from=2019-01-01&to=2019-02-01&granularity=week'
+        )
+        self.assertDictEqual(filters, {
+            'data_sources': ['A', 'B'],
+            'campaigns': ['C'],
+            'date_from': date(2019, 1, 1),
+            'date_to': date(2019, 2, 1),
+            'granularity': 'week',
+        })
+
+    def test_metrics(self):
+        filters = self.get_filters(
+            'metrics=ctr&metrics=clicks_cumulative&window=28'
+        )
+        self.assertDictEqual(filters, {
+            'metrics': ['ctr', 'clicks_cumulative'],
+            'window': 28,
+        })
+
+    def test_wrong_values_are_ignored(self):
+        filters = self.get_filters(
+            'from=2019-02-30&to=yesterday&granularity=year'
+            '&metrics=revenue&window=-1'
+        )
+        self.assertDictEqual(filters, {})
+
+
+class TestGetTrace(TestCase):
+    def setUp(self):
+        self.x_axis = [date(2019, 1, 1) + timedelta(days=i) for i in range(50)]
+        self.y_axis = list(range(50))
+
+    @override_settings(PLOT_MAX_POINTS=10, PLOT_WEBGL_THRESHOLD=1000)
+    def test_downsampled(self):
+        trace = IndexView._get_trace(self.x_axis, self.y_axis, 'Clicks')
+        self.assertIsInstance(trace, go.Scatter)
+        self.assertEqual(len(trace.x), 10)
+        self.assertEqual(len(trace.y), 10)
+
+    @override_settings(PLOT_MAX_POINTS=2000, PLOT_WEBGL_THRESHOLD=1000)
+    def test_viewport_budget(self):
+        trace = IndexView._get_trace(self.x_axis, self.y_axis, 'Clicks', 20)
+        self.assertEqual(len(trace.x), 20)
+
+    @override_settings(PLOT_MAX_POINTS=2000, PLOT_POINTS_STEP=250)
+    def test_max_points(self):
+        """
+        Ensures that close viewport widths get the same point budget.
+        """
+        self.assertEqual(IndexView._get_max_points('1280'), 1250)
+        self.assertEqual(IndexView._get_max_points('1366'), 1250)
+        self.assertEqual(IndexView._get_max_points('120'), 250)
+        self.assertEqual(IndexView._get_max_points('3840'), 2000)
+        self.assertIsNone(IndexView._get_max_points(''))
+
+    @override_settings(PLOT_MAX_POINTS=2000, PLOT_WEBGL_THRESHOLD=20)
+    def test_webgl(self):
+        trace = IndexView._get_trace(self.x_axis, self.y_axis, 'Clicks')
+        self.assertIsInstance(trace, go.Scattergl)
+        self.assertEqual(len(trace.x), 50)
+
+
+@mock.patch('app.views.refresh_db')
+class TestConditionalResponse(TestCase):
+    def test_not_modified(self, _mock_refresh_db):
+        """
+        Ensures that a client already having the page for the current data
+        and filters gets a 304.
+        """
+        RowDataF()
+        client = Client()
+        response = client.get('/', {'campaigns': 'Campaign ńámë'})
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
 
-class TestGetCampaignsDataSources(TestCase):
-    def test_get_distinct(self):
+        response = client.get(
+            '/', {'campaigns': 'Campaign ńámë'}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_modified(self, _mock_refresh_db):
+        """
+        Ensures that the ETag changes with the filters and the data.
+        """
         RowDataF()
+        view = IndexView()
+        request = RequestFactory().get('/')
+        etag = view.get_etag(request)
+
+        request_filtered = RequestFactory().get('/?campaigns=Other')
+        self.assertNotEqual(view.get_etag(request_filtered), etag)
+
+        request_other_path = RequestFactory().get('/data/')
+        self.assertNotEqual(view.get_etag(request_other_path), etag)
+
+        RowDataF(date=date(2019, 1, 1))
+        self.assertNotEqual(view.get_etag(request), etag)
+
+    def test_endpoints_differ(self, _mock_refresh_db):
+        """
+        Ensures that endpoints requested with the same query string get their
+        own ETag and compressed body.
+        """
+        cache.clear()
+        for day in range(1, 11):
+            RowDataF(date=date(2019, 1, day))
+        client = Client(HTTP_ACCEPT_ENCODING='gzip')
+        params = {'campaigns': 'Campaign ńámë'}
+        index = client.get('/', params)
+        data = client.get('/data/', params)
+        self.assertEqual(index['Content-Encoding'], 'gzip')
+        self.assertEqual(data['Content-Encoding'], 'gzip')
+        self.assertNotEqual(index['ETag'], data['ETag'])
+        self.assertNotEqual(
+            gzip.decompress(index.content), gzip.decompress(data.content)
+        )
+
+
+@mock.patch('app.views.refresh_db')
+class TestExportView(TestCase):
+    def setUp(self):
+        RowDataF(date=date(2019, 1, 1))
+        RowDataF(date=date(2019, 1, 1), clicks=2)
+        RowDataF(date=date(2019, 1, 2), campaign__name='Other')
+
+    def get_content(self, params: dict) -> str:
+        response = Client().get('/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_aggregates_csv(self, _mock_refresh_db):
+        content = self.get_content({'kind': 'aggregates', 'format': 'csv'})
+        self.assertEqual(
+            content,
+            'period,clicks_total,impressions_total\r\n'
+            '2019-01-01,3,20\r\n'
+            '2019-01-02,1,10\r\n',
+        )
+
+    def test_rows_ndjson(self, _mock_refresh_db):
+        content = self.get_content({
+            'kind': 'rows',
+            'format': 'ndjson',
+            'campaigns': 'Other',
+        })
+        self.assertEqual(content.count('\n'), 1)
+        self.assertDictEqual(json.loads(content), {
+            'date': '2019-01-02',
+            'data_source': 'DataSource ńámë',
+            'campaign': 'Other',
+            'clicks': 1,
+            'impressions': 10,
+        })
+
+    def test_wrong_parameters(self, _mock_refresh_db):
+        response = Client().get('/export/', {'kind': 'everything'})
+        self.assertEqual(response.status_code, 400)
+
+        response = Client().get('/export/', {'format': 'xlsx'})
+        self.assertEqual(response.status_code, 400)
+
+
+@mock.patch('app.views.refresh_db')
+class TestDataView(TestCase):
+    def test_series(self, _mock_refresh_db):
+        RowDataF(date=date(2019, 1, 1), clicks=1, impressions=10)
+        RowDataF(date=date(2019, 1, 2), clicks=3, impressions=10)
+
+        response = Client().get('/data/', {'metrics': 'clicks_cumulative'})
+        self.assertEqual(response.status_code, 200)
+        self.assertListEqual(response.json()['series'], [
+            {
+                'period': '2019-01-01',
+                'clicks_total': 1,
+                'impressions_total': 10,
+                'clicks_cumulative': 1,
+            },
+            {
+                'period': '2019-01-02',
+                'clicks_total': 3,
+                'impressions_total': 10,
+                'clicks_cumulative': 4,
+            },
+        ])
+
+    @override_settings(
+        PLOT_MAX_POINTS=2000, PLOT_POINTS_STEP=10, PLOT_WEBGL_THRESHOLD=5,
+    )
+    def test_traces(self, _mock_refresh_db):
+        """
+        Ensures that with a width, the series get downsampled into the same
+        kind of traces as the dashboard's.
+        """
+        for day in range(30):
+            RowDataF(date=date(2019, 1, 1) + timedelta(days=day), clicks=day)
+
+        response = Client().get('/data/', {'width': '20'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertNotIn('series', data)
+        clicks, impressions = data['traces']
+        self.assertEqual(clicks['type'], 'scattergl')
+        self.assertEqual(clicks['name'], 'Clicks')
+        self.assertEqual(len(clicks['x']), 20)
+        self.assertEqual(clicks['x'][0], '2019-01-01')
+        self.assertEqual(clicks['y'][-1], 29)
+        self.assertEqual(impressions['name'], 'Impressions')
+
+
+class TestGetApproximateData(TestCase):
+    def setUp(self):
+        RowDataF(date=date(2019, 1, 1), clicks=1, impressions=10)
+        RowDataF(date=date(2019, 1, 1), clicks=3, impressions=30)
+        RowDataF(date=date(2019, 1, 2), clicks=2, impressions=0)
+        RowDataF(date=date(2019, 1, 9), clicks=5, impressions=20)
+
+    def test_small_table(self):
+        """
+        Ensures that tables smaller than the sample are read in full, giving
+        the same series and metrics as the exact query, without error.
+        """
+        for granularity in GRANULARITIES:
+            filters = {
+                'metrics': list(METRICS),
+                'window': 2,
+                'granularity': granularity,
+            }
+            series, sample_percent = IndexView._get_approximate_data(filters)
+
+            self.assertEqual(sample_percent, 100)
+            for obj in series:
+                self.assertEqual(obj.pop('clicks_error'), 0)
+                self.assertEqual(obj.pop('impressions_error'), 0)
+            self.assertListEqual(
+                series, list(IndexView._get_filtered_data(filters)),
+            )
 
-        result = IndexView._get_distinct('campaign__name')
-        self.assertEqual(result.count(), 1)
-        self.assertEqual(result[0], 'Campaign ńámë')
+    @override_settings(APPROXIMATE_SAMPLE_ROWS=2)
+    def test_sample_percent(self):
+        """
+        Ensures that the sample gets sized by the rows of the latest
+        snapshot, not of the whole table.
+        """
+        for day in range(1, 21):
+            row_data = RowDataF(date=date(2018, 12, day))
+            row_data.date_created = date(2019, 10, 17)
+            row_data.save()
+        for day in range(1, 5):
+            RowDataF(date=date(2019, 2, day))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE app_rowdata')
+
+        self.assertEqual(IndexView._get_sample_percent('default'), 25)
+
+    def test_sampled_rows_with_joins(self):
+        """
+        Ensures that the sample gets taken from the outer RowData table when
+        the filters join other tables.
+        """
+        filters = {
+            'campaigns': ['Campaign ńámë'],
+            'data_sources': ['DataSource ńámë'],
+        }
+        qs = IndexView._get_filtered_rows(filters).annotate(
+            period=F('date'),
+        ).values(
+            'period',
+        ).annotate(
+            clicks_total=Sum('clicks'),
+        ).order_by('period')
+
+        with CaptureQueriesContext(connection) as queries:
+            rows = IndexView._get_sampled_rows(qs, 100)
+        self.assertListEqual(rows, list(qs))
+        self.assertIn(
+            'FROM "app_rowdata" TABLESAMPLE SYSTEM (100.000000) REPEATABLE '
+            '(0) INNER JOIN',
+            queries[0]['sql'],
+        )
+
+    @mock.patch.object(IndexView, '_get_sample_percent', return_value=50)
+    @mock.patch.object(
+        IndexView, '_get_sampled_rows',
+        side_effect=lambda qs, percent: list(qs),
+    )
+    def test_scaled_estimates(self, _mock_sampled_rows, _mock_percent):
+        """
+        Ensures that sampled totals get scaled up by the sampling rate, with
+        the bounds of their 95% confidence interval.
+        """
+        series, sample_percent = IndexView._get_approximate_data({})
+
+        self.assertEqual(sample_percent, 50)
+        self.assertEqual(series[0]['period'], date(2019, 1, 1))
+        self.assertEqual(series[0]['clicks_total'], 8)
+        self.assertEqual(series[0]['impressions_total'], 80)
+        # sqrt((1 - rate) / rate ** 2 * sum of squares)
+        self.assertAlmostEqual(series[0]['clicks_error'], 1.96 * 20 ** .5)
+        self.assertAlmostEqual(
+            series[0]['impressions_error'], 1.96 * 2000 ** .5,
+        )
+        self.assertEqual(series[1]['clicks_total'], 4)
+        self.assertEqual(series[1]['impressions_error'], 0)
+
+
+@mock.patch('app.views.refresh_db')
+class TestApproximateViews(TestCase):
+    def test_data_view(self, _mock_refresh_db):
+        RowDataF(date=date(2019, 1, 1), clicks=1, impressions=10)
+
+        response = Client().get('/data/', {'approximate': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertDictEqual(response.json(), {
+            'series': [{
+                'period': '2019-01-01',
+                'clicks_total': 1,
+                'impressions_total': 10,
+                'clicks_error': 0.0,
+                'impressions_error': 0.0,
+            }],
+            'sample_percent': 100,
+        })
+
+    @mock.patch.object(IndexView, '_get_sample_percent', return_value=10)
+    @mock.patch.object(
+        IndexView, '_get_sampled_rows',
+        side_effect=lambda qs, percent: list(qs),
+    )
+    def test_index_view(self, _mock_sampled_rows, _mock_percent,
+                        _mock_refresh_db):
+        """
+        Ensures that sampled dashboards load the exact series afterwards.
+        """
+        RowDataF(date=date(2019, 1, 1), clicks=1, impressions=10)
+
+        response = Client().get('/', {'approximate': '1', 'width': '600'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['approximate'])
+        self.assertContains(response, 'Estimated from 10.00% of the data')
+        self.assertContains(response, 'Plotly.react')
+
+        response = Client().get('/', {'width': '600'})
+        self.assertFalse(response.context['approximate'])
+        self.assertNotContains(response, 'Plotly.react')
+
+
+@mock.patch('app.views.refresh_db')
+class TestComparisonView(TestCase):
+    def test_previous_period(self, _mock_refresh_db):
+        """
+        Ensures the previous period gets aligned with the requested one.
+        """
+        RowDataF(date=date(2019, 1, 1), clicks=2, impressions=10)
+        RowDataF(date=date(2019, 1, 2), clicks=4, impressions=10)
+        RowDataF(date=date(2019, 1, 3), clicks=3, impressions=20)
+        RowDataF(date=date(2019, 1, 4), clicks=4, impressions=5)
+
+        response = Client().get('/compare/', {
+            'compare': 'previous_period',
+            'from': '2019-01-03',
+            'to': '2019-01-04',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertListEqual(response.json()['series'], [
+            {
+                'period': '2019-01-03',
+                'clicks_current': 3,
+                'clicks_previous': 2,
+                'clicks_delta': 1,
+                'clicks_delta_relative': 0.5,
+                'impressions_current': 20,
+                'impressions_previous': 10,
+                'impressions_delta': 10,
+                'impressions_delta_relative': 1.0,
+            },
+            {
+                'period': '2019-01-04',
+                'clicks_current': 4,
+                'clicks_previous': 4,
+                'clicks_delta': 0,
+                'clicks_delta_relative': 0.0,
+                'impressions_current': 5,
+                'impressions_previous': 10,
+                'impressions_delta': -5,
+                'impressions_delta_relative': -0.5,
+            },
+        ])
+
+    def test_previous_snapshot(self, _mock_refresh_db):
+        """
+        Ensures the latest snapshot gets compared with the previous one.
+        """
+        for clicks, day in ((5, 1), (1, 2)):
+            row_data = RowDataF(date=date(2019, 1, day), clicks=clicks)
+            row_data.date_created = date(2019, 10, 17)
+            row_data.save()
+        RowDataF(date=date(2019, 1, 1), clicks=6)
+        RowDataF(date=date(2019, 1, 3), clicks=2)
+
+        response = Client().get('/compare/', {'compare': 'previous_snapshot'})
+        series = response.json()['series']
+        self.assertListEqual(
+            [
+                (obj['period'], obj['clicks_current'],
+                 obj['clicks_previous'], obj['clicks_delta_relative'])
+                for obj in series
+            ],
+            [
+                ('2019-01-01', 6, 5, 0.2),
+                ('2019-01-02', 0, 1, -1.0),
+                ('2019-01-03', 2, 0, None),
+            ],
+        )
+
+    def test_wrong_parameters(self, _mock_refresh_db):
+        response = Client().get('/compare/', {'compare': 'last_year'})
+        self.assertEqual(response.status_code, 400)
+
+        response = Client().get('/compare/', {
+            'compare': 'previous_period', 'from': '2019-01-03',
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+class TestGetFacets(TestCase):
+    def setUp(self):
+        RowDataF(data_source__name='Facebook', campaign__name='Like Ads')
+        RowDataF(
+            data_source__name='Facebook', campaign__name='Offer', clicks=5
+        )
+        RowDataF(
+            data_source__name='Google', campaign__name='Like Ads', clicks=2
+        )
+
+    def test_without_selection(self):
+        data_sources, campaigns = IndexView._get_facets({})
+        self.assertListEqual(data_sources, [
+            {'name': 'Facebook', 'rows': 2, 'clicks': 6},
+            {'name': 'Google', 'rows': 1, 'clicks': 2},
+        ])
+        self.assertListEqual(campaigns, [
+            {'name': 'Offer', 'rows': 1, 'clicks': 5},
+            {'name': 'Like Ads', 'rows': 2, 'clicks': 3},
+        ])
+
+    def test_with_selection(self):
+        """
+        Ensures each dimension is narrowed down by the selection of the
+        other one, keeping selected options without data.
+        """
+        data_sources, campaigns = IndexView._get_facets({
+            'data_sources': ['Google'],
+            'campaigns': ['Offer', 'Gone'],
+        })
+        self.assertListEqual(data_sources, [
+            {'name': 'Facebook', 'rows': 1, 'clicks': 5},
+            {'name': 'Google', 'rows': 0, 'clicks': 0},
+        ])
+        self.assertListEqual(campaigns, [
+            {'name': 'Gone', 'rows': 0, 'clicks': 0},
+            {'name': 'Offer', 'rows': 0, 'clicks': 0},
+            {'name': 'Like Ads', 'rows': 1, 'clicks': 2},
+        ])
+
+    @override_settings(MAX_CAMPAIGN_OPTIONS=1)
+    def test_top_campaigns(self):
+        """
+        Ensures only the top campaigns by clicks are listed after the
+        selected ones.
+        """
+        _data_sources, campaigns = IndexView._get_facets({})
+        self.assertListEqual(campaigns, [
+            {'name': 'Offer', 'rows': 1, 'clicks': 5},
+        ])
+
+        _data_sources, campaigns = IndexView._get_facets({
+            'campaigns': ['Offer'],
+        })
+        self.assertListEqual(campaigns, [
+            {'name': 'Offer', 'rows': 1, 'clicks': 5},
+            {'name': 'Like Ads', 'rows': 2, 'clicks': 3},
+        ])
+
+    def test_single_query(self):
+        """
+        Ensures both dimensions come from a single scan of the snapshot.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            IndexView._get_facets({
+                'data_sources': ['Google'],
+                'campaigns': ['Offer'],
+            })
+        self.assertEqual(len(queries), 1)
+        self.assertIn('GROUPING SETS', queries[0]['sql'])
+
+
+class TestSearchView(TestCase):
+    def setUp(self):
+        data_source = DataSourceF(name='Google Ads')
+        for name in ('Like Ads', 'Offer Ads', 'Brand', 'Ads Prio 1'):
+            RowDataF(campaign__name=name, data_source=data_source)
+
+    def test_search(self):
+        response = Client().get('/search/', {'q': 'ads'})
+        self.assertDictEqual(response.json(), {
+            'results': ['Ads Prio 1', 'Like Ads', 'Offer Ads'],
+            'next': None,
+        })
+
+        response = Client().get('/search/', {'q': 'ads', 'match': 'prefix'})
+        self.assertListEqual(response.json()['results'], ['Ads Prio 1'])
+
+        response = Client().get(
+            '/search/', {'q': 'ads', 'dimension': 'data_source'}
+        )
+        self.assertListEqual(response.json()['results'], ['Google Ads'])
+
+    def test_latest_snapshot(self):
+        """
+        Ensures names without rows in the latest snapshot are not found.
+        """
+        CampaignF(name='Unused Ads')
+        row_data = RowDataF(campaign__name='Old Ads')
+        row_data.date_created = date(2019, 10, 17)
+        row_data.save()
+        RowDataF(campaign__name='New Ads')
+
+        response = Client().get('/search/', {'q': 'ads', 'limit': 100})
+        self.assertListEqual(
+            response.json()['results'],
+            ['Ads Prio 1', 'Like Ads', 'New Ads', 'Offer Ads'],
+        )
+
+    def test_pagination(self):
+        """
+        Ensures results are paginated by name with the `next` cursor.
+        """
+        response = Client().get('/search/', {'q': 'ads', 'limit': 2})
+        self.assertDictEqual(response.json(), {
+            'results': ['Ads Prio 1', 'Like Ads'],
+            'next': 'Like Ads',
+        })
+
+        response = Client().get(
+            '/search/', {'q': 'ads', 'limit': 2, 'after': 'Like Ads'}
+        )
+        self.assertDictEqual(response.json(), {
+            'results': ['Offer Ads'],
+            'next': None,
+        })
+
+    def test_wrong_parameters(self):
+        response = Client().get('/search/', {'dimension': 'date'})
+        self.assertEqual(response.status_code, 400)
+
+        response = Client().get('/search/', {'limit': 'all'})
+        self.assertEqual(response.status_code, 400)
+
+
+@mock.patch('app.views.refresh_db')
+class TestBreakdownView(TestCase):
+    def setUp(self):
+        RowDataF(campaign__name='A', date=date(2019, 1, 1), clicks=10)
+        RowDataF(campaign__name='A', date=date(2019, 1, 2), clicks=5)
+        RowDataF(campaign__name='B', clicks=20, impressions=1)
+        RowDataF(campaign__name='C', clicks=3, impressions=100)
+        RowDataF(campaign__name='D', clicks=2, impressions=50)
+
+    def test_top_n(self, _mock_refresh_db):
+        response = Client().get('/breakdown/', {'n': 2})
+        self.assertDictEqual(response.json(), {
+            'by': 'campaign',
+            'metric': 'clicks',
+            'top': [
+                {'name': 'B', 'clicks_total': 20, 'impressions_total': 1},
+                {'name': 'A', 'clicks_total': 15, 'impressions_total': 20},
+            ],
+            'other': {
+                'members': 2, 'clicks_total': 5, 'impressions_total': 150,
+            },
+        })
+
+    def test_without_other(self, _mock_refresh_db):
+        response = Client().get('/breakdown/', {
+            'n': 10, 'metric': 'impressions', 'by': 'data_source',
+        })
+        self.assertDictEqual(response.json(), {
+            'by': 'data_source',
+            'metric': 'impressions',
+            'top': [
+                {
+                    'name': 'DataSource ńámë',
+                    'clicks_total': 40,
+                    'impressions_total': 171,
+                },
+            ],
+            'other': None,
+        })
+
+    def test_series(self, _mock_refresh_db):
+        response = Client().get('/breakdown/', {
+            'n': 1, 'metric': 'impressions', 'series': 1,
+            'to': '2019-01-01',
+        })
+        self.assertDictEqual(response.json()['series'], {'A': [
+            {'period': '2019-01-01', 'clicks_total': 10,
+             'impressions_total': 10},
+        ]})
 
-        result = IndexView._get_distinct('data_source__name')
-        self.assertEqual(result.count(), 1)
-        self.assertEqual(result[0], 'DataSource ńámë')
+    def test_wrong_parameters(self, _mock_refresh_db):
+        for params in ({'by': 'date'}, {'metric': 'ctr'}, {'n': 'all'}):
+            response = Client().get('/breakdown/', params)
+            self.assertEqual(response.status_code, 400)
@@ -0,0 +1,129 @@
+from datetime import date, timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .factories import RowDataF
+from ..models import FilterSelection
+from ..signals import data_stored
+from ..views import IndexView
+from ..warming import (
+    deserialize_filters, get_popular_selections, record_selection,
+    serialize_filters, warm_dashboards,
+)
+
+
+class TestSerializeFilters(TestCase):
+    def test_equivalent_filters(self):
+        """
+        Ensures that the same selection serializes the same regardless of
+        the order and repetitions of its values.
+        """
+        self.assertEqual(
+            serialize_filters({
+                'campaigns': ['b', 'a', 'b'],
+                'date_from': date(2019, 1, 1),
+            }),
+            serialize_filters({
+                'date_from': date(2019, 1, 1),
+                'campaigns': ['a', 'b'],
+            }),
+        )
+
+    def test_round_trip(self):
+        filters = {
+            'data_sources': ['a', 'b'],
+            'date_to': date(2019, 1, 31),
+            'window': 7,
+        }
+        self.assertEqual(
+            deserialize_filters(serialize_filters(filters)), filters,
+        )
+
+
+@override_settings(FILTER_SELECTION_SAMPLE_RATE=1)
+class TestRecordSelection(TestCase):
+    def test_counts_hits(self):
+        """
+        Ensures that equivalent selections are counted together, separately
+        per point budget, and that the most requested come first.
+        """
+        record_selection({'campaigns': ['a', 'b']}, None)
+        record_selection({'campaigns': ['b', 'a']}, None)
+        record_selection({'campaigns': ['a', 'b']}, 800)
+        record_selection({}, None)
+        record_selection({}, None)
+        record_selection({}, None)
+
+        self.assertEqual(FilterSelection.objects.count(), 3)
+        self.assertEqual(get_popular_selections(2), [
+            ({}, None),
+            ({'campaigns': ['a', 'b']}, None),
+        ])
+
+    def test_sampled(self):
+        """
+        Ensures only a share of the requests get counted.
+        """
+        with override_settings(FILTER_SELECTION_SAMPLE_RATE=0.5):
+            with mock.patch('random.random', side_effect=[0.7, 0.2, 0.5]):
+                for _i in range(3):
+                    record_selection({}, None)
+
+        self.assertEqual(FilterSelection.objects.get().hits, 1)
+
+
+class TestWarmCache(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        RowDataF(date_created=date(2019, 1, 1))
+
+    def test_warm_cache(self):
+        """
+        Ensures that the recorded dashboards get computed when data gets
+        stored, so they are served from the cache afterwards.
+        """
+        filters = {'data_sources': ['DataSource ńámë']}
+        with override_settings(FILTER_SELECTION_SAMPLE_RATE=1):
+            record_selection(filters, 500)
+
+        # Warmed in the background
+        for _receiver, future in data_stored.send(sender=None, run=None):
+            future.result()
+
+        view = IndexView()
+        with mock.patch.object(IndexView, '_get_filtered_data') as get_data:
+            dashboard = view.get_dashboard(filters, 500)
+            get_data.assert_not_called()
+        self.assertIn('plotly', dashboard['plot_div'])
+        self.assertEqual(
+            [option['name'] for option in dashboard['data_sources']],
+            ['DataSource ńámë'],
+        )
+
+        with mock.patch.object(IndexView, '_get_filtered_data') as get_data:
+            view.get_dashboard(filters, 800)
+            get_data.assert_called_once()
+
+    @override_settings(FILTER_SELECTION_MAX_AGE_DAYS=30)
+    def test_forgets_unused_selections(self):
+        """
+        Ensures that the selections unused for too long get deleted and
+        not warmed.
+        """
+        FilterSelection.objects.create(key='new', filters='{}', hits=1)
+        FilterSelection.objects.create(key='old', filters='{}', hits=5)
+        FilterSelection.objects.filter(key='old').update(
+            date_last_used=timezone.now() - timedelta(days=31),
+        )
+
+        with mock.patch.object(IndexView, 'get_dashboard') as get_dashboard:
+            warm_dashboards()
+            get_dashboard.assert_called_once_with({}, None)
+        self.assertListEqual(
+            list(FilterSelection.objects.values_list('key', flat=True)),
+            ['new'],
+        )
@@ -1,7 +1,15 @@
 from django.urls import path
 
-from .views import IndexView
+from .views import (
+    BreakdownView, ComparisonView, DataView, ExportView, IndexView,
+    SearchView,
+)
 
 urlpatterns = [
     path('', IndexView.as_view(), name='index'),
+    path('breakdown/', BreakdownView.as_view(), name='breakdown'),
+    path('compare/', ComparisonView.as_view(), name='compare'),
+    path('data/', DataView.as_view(), name='data'),
+    path('export/', ExportView.as_view(), name='export'),
+    path('search/', SearchView.as_view(), name='search'),
 ]
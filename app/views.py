@@ -1,100 +1,1096 @@
-from plotly.offline import plot
+import csv
+from datetime import date, datetime, timedelta
+import hashlib
+import json
+import math
+from operator import itemgetter
+from typing import (
+    Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple,
+)
+
+from plotly.offline import get_plotlyjs, plot
 import plotly.graph_objs as go
 
-from django.db.models import Subquery, Sum
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, router
+from django.db.models import (
+    Case, DateField, DateTimeField, Exists, ExpressionWrapper, F,
+    FloatField, Func, IntegerField, OuterRef, Q, Subquery, Sum, When, Window,
+)
+from django.db.models.expressions import WindowFrame
+from django.db.models.functions import (
+    Cast, Coalesce, NullIf, RowNumber, Trunc,
+)
 from django.db.models.query import QuerySet
-from django.views.generic import TemplateView
+from django.http import (
+    HttpRequest, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse,
+)
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import condition
+from django.views.generic import TemplateView, View
+
+from .downsampling import lttb
+from .models import Campaign, DataSource, RowData
+from .routers import replica_reads
+from .storage import (
+    get_dataset_version, get_latest_generation, get_published_rows,
+    latest_generation, refresh_db,
+)
+from .warming import (
+    deserialize_filters, record_selection, serialize_filters,
+)
+
+
+GRANULARITIES = ('day', 'week', 'month')
+
+# Series derived from the clicks and impressions totals, with their names
+METRICS = {
+    'ctr': 'CTR',
+    'clicks_cumulative': 'Cumulative clicks',
+    'impressions_cumulative': 'Cumulative impressions',
+    'clicks_moving_average': 'Clicks moving average',
+    'impressions_moving_average': 'Impressions moving average',
+}
+
+SEARCH_MODELS = {
+    'campaign': Campaign,
+    'data_source': DataSource,
+}
+
+BREAKDOWN_DIMENSIONS = ('campaign', 'data_source')
+
+BREAKDOWN_METRICS = ('clicks', 'impressions')
+
+COMPARISONS = ('previous_period', 'previous_snapshot')
+
+# Standard scores of the error bounds of approximate results (95%)
+APPROXIMATE_Z = 1.96
+
+EXPORT_COLUMNS = {
+    'aggregates': ('period', 'clicks_total', 'impressions_total'),
+    'rows': (
+        'date', 'data_source__name', 'campaign__name', 'clicks', 'impressions'
+    ),
+}
+
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class OverAggregate(Func):
+    """
+    Aggregate function to be used in a Window over an aggregate, e.g.
+    SUM(SUM(clicks)) OVER (...), which Django aggregates do not allow.
+    """
+    window_compatible = True
+    contains_aggregate = False
+
+
+class PeriodRange(WindowFrame):
+    """
+    Window frame spanning the current period and the `size - 1` previous
+    ones by date, e.g. RANGE BETWEEN INTERVAL '6 days' PRECEDING AND CURRENT
+    ROW, so periods without rows do not stretch it.
+    """
+    frame_type = 'RANGE'
+
+    def __init__(self, size: int, granularity: str):
+        super().__init__(start=-(size - 1), end=0)
+        self.granularity = granularity
+
+    def window_frame_start_end(self, connection, start, end):
+        return (
+            f"INTERVAL '{-start} {self.granularity}s' PRECEDING",
+            connection.ops.CURRENT_ROW,
+        )
+
+
+class FiltersMixin:
+    """
+    Reads the data filters from the request's query string.
+    """
+    request: HttpRequest
+
+    @staticmethod
+    def _parse_date(value: str) -> Optional[date]:
+        try:
+            return parse_date(value)
+        except ValueError:
+            return None
+
+    def get_filters(self) -> dict:
+        filters = {}
+        selected_data_sources = self.request.GET.getlist('data-sources')
+        if selected_data_sources:
+            filters['data_sources'] = selected_data_sources
+
+        selected_campaigns = self.request.GET.getlist('campaigns')
+        if selected_campaigns:
+            filters['campaigns'] = selected_campaigns
+
+        date_from = self._parse_date(self.request.GET.get('from', ''))
+        if date_from:
+            filters['date_from'] = date_from
+
+        date_to = self._parse_date(self.request.GET.get('to', ''))
+        if date_to:
+            filters['date_to'] = date_to
+
+        granularity = self.request.GET.get('granularity')
+        if granularity in GRANULARITIES:
+            filters['granularity'] = granularity
+
+        metrics = [
+            metric for metric in self.request.GET.getlist('metrics')
+            if metric in METRICS
+        ]
+        if metrics:
+            filters['metrics'] = metrics
+
+        try:
+            window = int(self.request.GET.get('window', ''))
+        except ValueError:
+            window = 0
+        if window > 0:
+            filters['window'] = min(window, settings.MAX_MOVING_AVERAGE_WINDOW)
+
+        return filters
+
+    @staticmethod
+    def _get_latest_date_created() -> Func:
+        return latest_generation()
+
+    @staticmethod
+    def _get_period(granularity: str, expression=F('date')):
+        if granularity == 'day':
+            return expression
+        return Trunc(expression, granularity, output_field=DateField())
+
+    @classmethod
+    def _get_filtered_rows(cls, filters) -> QuerySet:
+        """
+        Rows of the latest date_created matching the filters.
+        """
+        qs = get_published_rows().filter(
+            date_created=cls._get_latest_date_created(),
+        )
+        return cls._filter_rows(qs, filters)
+
+    @staticmethod
+    def _filter_rows(qs: QuerySet, filters) -> QuerySet:
+        if filters.get('date_from'):
+            qs = qs.filter(date__gte=filters['date_from'])
+
+        if filters.get('date_to'):
+            qs = qs.filter(date__lte=filters['date_to'])
+
+        if filters.get('data_sources'):
+            qs = qs.filter(data_source__name__in=filters['data_sources'])
+
+        if filters.get('campaigns'):
+            qs = qs.filter(campaign__name__in=filters['campaigns'])
+
+        return qs
+
+    @classmethod
+    def _get_filtered_data(cls, filters) -> QuerySet:
+        """
+        Groups by latest date_created, in periods of the filters' granularity
+        (day by default). The requested metrics are computed in the same
+        query, with window functions over the grouped rows.
+        """
+        granularity = filters.get('granularity', 'day')
+        period = cls._get_period(granularity)
+
+        window = filters.get('window', settings.MOVING_AVERAGE_WINDOW)
+        metrics = {
+            metric: cls._get_metric(metric, window, granularity)
+            for metric in filters.get('metrics', [])
+        }
+
+        return cls._get_filtered_rows(filters).annotate(
+            period=period,
+        ).values(
+            'period'
+        ).annotate(
+            clicks_total=Sum('clicks'),
+            impressions_total=Sum('impressions'),
+            **metrics,
+        ).order_by(
+            'period'
+        )
+
+    @staticmethod
+    def _get_metric(metric: str, window: int, granularity: str):
+        """
+        Expression of a derived metric. Moving averages span the current
+        period and the `window - 1` previous ones, periods without rows
+        counting as zero.
+        """
+        if metric == 'ctr':
+            return ExpressionWrapper(
+                Cast(Sum('clicks'), FloatField()) /
+                NullIf(Sum('impressions'), 0),
+                output_field=FloatField(),
+            )
+
+        column, kind = metric.split('_', 1)
+        if kind == 'cumulative':
+            return Window(
+                OverAggregate(Sum(column), function='SUM'),
+                order_by=F('period').asc(),
+                output_field=IntegerField(),
+            )
+        return Window(
+            OverAggregate(
+                Cast(Sum(column), FloatField()) / window, function='SUM',
+            ),
+            order_by=F('period').asc(),
+            frame=PeriodRange(window, granularity),
+            output_field=FloatField(),
+        )
+
+    @classmethod
+    def _get_approximate_data(cls, filters) -> Tuple[List[dict], float]:
+        """
+        Estimates _get_filtered_data from a TABLESAMPLE SYSTEM sample of
+        about APPROXIMATE_SAMPLE_ROWS rows, so its cost does not grow with
+        the table. Totals are scaled up by the sampling rate and come with
+        the half-width of their confidence interval in `clicks_error` and
+        `impressions_error`. Also returns the percent of the table sampled:
+        small tables are read in full, giving exact results.
+
+        The error bounds assume that rows get sampled independently, while
+        SYSTEM samples whole pages, so they are optimistic for data stored
+        in clusters.
+        """
+        period = cls._get_period(filters.get('granularity', 'day'))
+        qs = cls._get_filtered_rows(filters).annotate(
+            period=period,
+        ).values(
+            'period'
+        ).annotate(
+            clicks_total=Sum('clicks'),
+            impressions_total=Sum('impressions'),
+            clicks_squares=Sum(cls._get_square('clicks')),
+            impressions_squares=Sum(cls._get_square('impressions')),
+        ).order_by(
+            'period'
+        )
+        percent = cls._get_sample_percent(qs.db)
+        if percent < 100:
+            rows = cls._get_sampled_rows(qs, percent)
+        else:
+            rows = list(qs)
+
+        rate = percent / 100
+        series = []
+        for row in rows:
+            obj = {'period': row['period']}
+            for column in ('clicks', 'impressions'):
+                # Horvitz-Thompson estimate of the sum and of its variance
+                variance = (1 - rate) / rate ** 2 * row[f'{column}_squares']
+                obj[f'{column}_total'] = round(row[f'{column}_total'] / rate)
+                obj[f'{column}_error'] = APPROXIMATE_Z * math.sqrt(variance)
+            series.append(obj)
+
+        cls._add_metrics(
+            series,
+            filters.get('metrics', []),
+            filters.get('window', settings.MOVING_AVERAGE_WINDOW),
+            filters.get('granularity', 'day'),
+        )
+        return series, percent
+
+    @staticmethod
+    def _get_sampled_rows(qs: QuerySet, percent: float) -> List[dict]:
+        """
+        Runs the query over a sample of `percent` of the RowData pages. The
+        sample is the same on every run over the same data.
+        """
+        sql, params = qs.query.sql_with_params()
+        # The outer FROM comes first: the latest date_created subquery still
+        # reads the whole table
+        table = connections[qs.db].ops.quote_name(RowData._meta.db_table)
+        sql = sql.replace(
+            f'FROM {table}',
+            f'FROM {table} TABLESAMPLE SYSTEM ({percent:f}) REPEATABLE (0)',
+            1,
+        )
+
+        with connections[qs.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+        for row in rows:
+            # Not converted by Django, DATE_TRUNC returns timestamps
+            if isinstance(row['period'], datetime):
+                row['period'] = row['period'].date()
+        return rows
+
+    @staticmethod
+    def _get_square(column: str):
+        # As float, squared integer columns could overflow
+        value = Cast(F(column), FloatField())
+        return ExpressionWrapper(value * value, output_field=FloatField())
+
+    @staticmethod
+    def _get_sample_percent(using: str) -> float:
+        """
+        Percent of the RowData pages holding about APPROXIMATE_SAMPLE_ROWS
+        rows of the latest snapshot, the only one queried, according to the
+        planner's estimate of its rows. 100 when the snapshot is smaller or
+        the database does not support TABLESAMPLE.
+
+        A snapshot missing from the planner statistics, until the table gets
+        analyzed after its ingest, is estimated small and read in full.
+        """
+        if connections[using].vendor != 'postgresql':
+            return 100
+
+        latest = get_latest_generation(using)
+        if latest is None:
+            return 100
+
+        qs = RowData.objects.using(using).filter(date_created=latest)
+        sql, params = qs.query.sql_with_params()
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        row_count = plan[0]['Plan']['Plan Rows']
+
+        if row_count <= settings.APPROXIMATE_SAMPLE_ROWS:
+            return 100
+        return 100 * settings.APPROXIMATE_SAMPLE_ROWS / row_count
+
+    @staticmethod
+    def _get_period_number(period: date, granularity: str) -> int:
+        """
+        Consecutive periods of a granularity get consecutive numbers.
+        """
+        if granularity == 'month':
+            return period.year * 12 + period.month
+        if granularity == 'week':
+            return period.toordinal() // 7
+        return period.toordinal()
+
+    @classmethod
+    def _add_metrics(cls, series: List[dict], metrics: Sequence[str],
+                     window: int, granularity: str) -> None:
+        """
+        Adds the derived metrics to a series of totals, as _get_metric does
+        in the database.
+        """
+        periods = [
+            cls._get_period_number(obj['period'], granularity)
+            for obj in series
+        ]
+        for metric in metrics:
+            if metric == 'ctr':
+                for obj in series:
+                    obj[metric] = (
+                        obj['clicks_total'] / obj['impressions_total']
+                        if obj['impressions_total'] else None
+                    )
+                continue
+
+            column, kind = metric.split('_', 1)
+            totals = [obj[f'{column}_total'] for obj in series]
+            cumulative = 0
+            moving = 0
+            start = 0
+            for i, obj in enumerate(series):
+                cumulative += totals[i]
+                moving += totals[i]
+                while periods[start] <= periods[i] - window:
+                    moving -= totals[start]
+                    start += 1
+                if kind == 'cumulative':
+                    obj[metric] = cumulative
+                else:
+                    obj[metric] = moving / window
 
-from .models import RowData
-from .storage import refresh_db
 
+class ReplicaReadMixin:
+    """
+    Reads from the replica database, when there is an up-to-date one.
+    """
+    def dispatch(self, request, *args, **kwargs):
+        with replica_reads():
+            return super().dispatch(request, *args, **kwargs)
 
-class IndexView(TemplateView):
+
+class DatasetConditionalMixin:
+    """
+    Refreshes the data and answers with a 304 when the client already has
+    the response for the current dataset version, path and query string. The
+    response gets read from the replica database, when there is an
+    up-to-date one.
+    """
+    def get_etag(self, request, *args, **kwargs) -> str:
+        query = sorted(request.GET.lists())
+        key = f'{get_dataset_version()}:{request.path}:{query}'
+        return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+    def dispatch(self, request, *args, **kwargs):
+        refresh_db()
+        with replica_reads():
+            view = condition(etag_func=self.get_etag)(super().dispatch)
+            return view(request, *args, **kwargs)
+
+
+class IndexView(DatasetConditionalMixin, FiltersMixin, TemplateView):
     template_name = 'index.html'
 
-    def _get_plot_div(self, qs: QuerySet):
+    @classmethod
+    def _get_traces(cls, qs: Iterable[dict],
+                    max_points: Optional[int] = None,
+                    metrics: Sequence[str] = ()) -> list:
+        """
+        Clicks, impressions and `metrics` traces of the series, see
+        _get_trace.
+        """
         x_axis = []
         y_axis_clicks = []
         y_axis_impressions = []
+        y_axis_metrics: Dict[str, list] = {metric: [] for metric in metrics}
+        # Error bounds of approximate results
+        errors_clicks = []
+        errors_impressions = []
 
         for obj in qs:
-            x_axis.append(obj['date'])
+            x_axis.append(obj['period'])
             y_axis_clicks.append(obj['clicks_total'])
             y_axis_impressions.append(obj['impressions_total'])
+            for metric in metrics:
+                y_axis_metrics[metric].append(obj[metric])
+            if 'clicks_error' in obj:
+                errors_clicks.append(obj['clicks_error'])
+                errors_impressions.append(obj['impressions_error'])
 
+        traces = [
+            cls._get_trace(
+                x_axis, y_axis_clicks, 'Clicks', max_points, errors_clicks,
+            ),
+            cls._get_trace(
+                x_axis, y_axis_impressions, 'Impressions', max_points,
+                errors_impressions,
+            ),
+        ]
+        for metric in metrics:
+            trace = cls._get_trace(
+                x_axis, y_axis_metrics[metric], METRICS[metric], max_points,
+            )
+            if metric == 'ctr':
+                trace.yaxis = 'y2'
+            traces.append(trace)
+        return traces
+
+    def _get_plot_div(self, qs: Iterable[dict],
+                      max_points: Optional[int] = None,
+                      metrics: Sequence[str] = ()):
         fig = go.Figure()
-        fig.add_trace(go.Scatter(
-            x=x_axis,
-            y=y_axis_clicks,
-            name='Clicks',
-        ))
-        fig.add_trace(go.Scatter(
-            x=x_axis,
-            y=y_axis_impressions,
-            name='Impressions',
-        ))
+        for trace in self._get_traces(qs, max_points, metrics):
+            fig.add_trace(trace)
         fig.update_layout(
             xaxis_tickformat='%d.%m.%y'
         )
+        if 'ctr' in metrics:
+            fig.update_layout(yaxis2=dict(
+                overlaying='y', side='right', tickformat='.2%',
+            ))
         fig.update_layout(legend=dict(x=1, y=1.2))
-        return plot(fig, output_type='div')
+        # plotly.js gets included once by the template
+        return plot(fig, output_type='div', include_plotlyjs=False)
+
+    @staticmethod
+    def _get_trace(x_axis: list, y_axis: list, name: str,
+                   max_points: Optional[int] = None,
+                   errors: Sequence[float] = ()):
+        """
+        Builds a trace downsampled with LTTB to at most `max_points` points,
+        with `errors` as error bars when given. Above PLOT_WEBGL_THRESHOLD
+        points, a WebGL trace gets used instead.
+        """
+        if max_points is None:
+            max_points = settings.PLOT_MAX_POINTS
+        max_points = min(max_points, settings.PLOT_MAX_POINTS)
+
+        x_ordinals = [x.toordinal() for x in x_axis]
+        y_values = [y or 0 for y in y_axis]
+        indexes = lttb(x_ordinals, y_values, max_points)
+        x_axis = [x_axis[i] for i in indexes]
+        y_axis = [y_axis[i] for i in indexes]
+        error_y = None
+        if any(errors):
+            error_y = dict(type='data', array=[errors[i] for i in indexes])
+
+        if len(x_axis) > settings.PLOT_WEBGL_THRESHOLD:
+            return go.Scattergl(x=x_axis, y=y_axis, name=name, error_y=error_y)
+        return go.Scatter(x=x_axis, y=y_axis, name=name, error_y=error_y)
 
     @staticmethod
-    def _get_filtered_data(filters) -> QuerySet:
+    def _get_max_points(width: str) -> Optional[int]:
         """
-        Groups by latest date_created
+        Point budget for the viewport: more than a point per pixel can not be
+        displayed anyway. Rounded down to a multiple of PLOT_POINTS_STEP, so
+        close widths share their cached dashboards.
         """
-        newest = RowData.objects.order_by('-id')
-        qs = RowData.objects.values(
-            'date'
+        try:
+            points = int(width)
+        except ValueError:
+            return None
+        step = settings.PLOT_POINTS_STEP
+        return min(max(points // step * step, step), settings.PLOT_MAX_POINTS)
+
+    @classmethod
+    def _get_facets(cls, filters) -> Tuple[List[dict], List[dict]]:
+        """
+        Data source and campaign options, with their rows and clicks, from
+        the latest snapshot. Data sources are narrowed down by the selected
+        campaigns and campaigns by the selected data sources. Selected
+        options are always kept, so they can be unselected, followed by the
+        top MAX_CAMPAIGN_OPTIONS other campaigns by clicks; the rest are
+        found through the search endpoint.
+
+        Both dimensions are grouped in a single scan of the snapshot, with
+        GROUPING SETS, each one counting only the rows matching the
+        selection of the other one. The campaigns are ranked with a window.
+        """
+        selected_data_sources = filters.get('data_sources', [])
+        selected_campaigns = filters.get('campaigns', [])
+        rows = cls._filter_rows(
+            get_published_rows().filter(
+                date_created=cls._get_latest_date_created(),
+            ),
+            {
+                'date_from': filters.get('date_from'),
+                'date_to': filters.get('date_to'),
+            },
+        ).values(
+            'clicks',
+            data_source_name=F('data_source__name'),
+            campaign_name=F('campaign__name'),
+        )
+        rows_sql, rows_params = rows.query.sql_with_params()
+
+        # Rows of the selected options, or all of them without selection
+        in_data_sources = 'TRUE'
+        in_campaigns = 'TRUE'
+        params: List[Any] = [selected_campaigns]
+        if selected_data_sources:
+            in_data_sources = 'data_source_name = ANY(%s)'
+        if selected_campaigns:
+            in_campaigns = 'campaign_name = ANY(%s)'
+        for names in (selected_campaigns, selected_data_sources) * 2:
+            if names:
+                params.append(names)
+        params += rows_params
+        params.append(settings.MAX_CAMPAIGN_OPTIONS)
+
+        sql = f"""
+            SELECT dimension, name, rows, clicks FROM (
+                SELECT
+                    dimension, name, rows, clicks, selected,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY dimension, selected
+                        ORDER BY clicks DESC, name
+                    ) AS rank
+                FROM (
+                    SELECT
+                        dimension,
+                        COALESCE(data_source_name, campaign_name) AS name,
+                        rows,
+                        clicks,
+                        campaign_name = ANY(%s) AS selected
+                    FROM (
+                        SELECT
+                            CASE WHEN GROUPING(data_source_name) = 0
+                                THEN 'data_source' ELSE 'campaign'
+                            END AS dimension,
+                            data_source_name,
+                            campaign_name,
+                            CASE WHEN GROUPING(data_source_name) = 0
+                                THEN COUNT(*) FILTER (WHERE {in_campaigns})
+                                ELSE COUNT(*) FILTER (WHERE {in_data_sources})
+                            END AS rows,
+                            CASE WHEN GROUPING(data_source_name) = 0
+                                THEN SUM(clicks) FILTER (WHERE {in_campaigns})
+                                ELSE SUM(clicks) FILTER (
+                                    WHERE {in_data_sources}
+                                )
+                            END AS clicks
+                        FROM ({rows_sql}) AS snapshot
+                        GROUP BY GROUPING SETS (
+                            (data_source_name), (campaign_name)
+                        )
+                    ) AS grouped
+                    WHERE rows > 0
+                ) AS options
+            ) AS ranked
+            WHERE dimension = 'data_source' OR selected OR rank <= %s
+            ORDER BY rank
+        """
+        options: Dict[str, List[dict]] = {'data_source': [], 'campaign': []}
+        with connections[rows.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            for dimension, name, count, clicks in cursor.fetchall():
+                options[dimension].append(
+                    {'name': name, 'rows': count, 'clicks': clicks},
+                )
+
+        def with_selected(options: List[dict],
+                          names: List[str]) -> List[dict]:
+            by_name = {
+                name: {'name': name, 'rows': 0, 'clicks': 0}
+                for name in names
+            }
+            by_name.update((option['name'], option) for option in options)
+            return sorted(by_name.values(), key=itemgetter('name'))
+
+        data_sources = with_selected(
+            options['data_source'], selected_data_sources,
+        )
+        campaigns = []
+        if selected_campaigns:
+            campaigns = with_selected(
+                [
+                    option for option in options['campaign']
+                    if option['name'] in selected_campaigns
+                ],
+                selected_campaigns,
+            )
+        campaigns += [
+            option for option in options['campaign']
+            if option['name'] not in selected_campaigns
+        ]
+
+        return data_sources, campaigns
+
+    def get_dashboard(self, filters, max_points: Optional[int] = None,
+                      approximate: bool = False) -> dict:
+        """
+        Plot and options for the filters, cached per dataset version so the
+        dashboards warmed up after an ingest get served from the cache. The
+        plot is estimated from a sample of the data with `approximate`, see
+        _get_approximate_data.
+        """
+        serialized_filters = serialize_filters(filters)
+        key = (
+            f'{get_dataset_version()}:{serialized_filters}:{max_points}:'
+            f'{approximate}'
+        )
+        cache_key = 'dashboard:{}'.format(
+            hashlib.md5(key.encode('utf-8')).hexdigest()
+        )
+        dashboard = cache.get(cache_key)
+        if dashboard is not None:
+            return dashboard
+
+        # Equivalent filters get the same cache entry, so render the same
+        filters = deserialize_filters(serialized_filters)
+        sample_percent = 100.0
+        if approximate:
+            series, sample_percent = self._get_approximate_data(filters)
+            plot_div = self._get_plot_div(
+                series, max_points, filters.get('metrics', []),
+            )
+        else:
+            plot_div = self._get_plot_div(
+                self._get_filtered_data(filters),
+                max_points,
+                filters.get('metrics', []),
+            )
+        data_sources, campaigns = self._get_facets(filters)
+
+        dashboard = {
+            'plot_div': plot_div,
+            'data_sources': data_sources,
+            'campaigns': campaigns,
+            'sample_percent': sample_percent,
+        }
+        cache.set(cache_key, dashboard, settings.DASHBOARD_CACHE_TIMEOUT)
+        return dashboard
+
+    def get_context_data(self, **kwargs):
+        filters = self.get_filters()
+        max_points = self._get_max_points(self.request.GET.get('width', ''))
+        metrics = filters.get('metrics', [])
+        approximate = bool(self.request.GET.get('approximate'))
+        record_selection(filters, max_points)
+
+        context = super().get_context_data(**kwargs)
+        context.update(self.get_dashboard(filters, max_points, approximate))
+        # Estimates get replaced by the exact traces in the browser
+        context['approximate'] = context['sample_percent'] < 100
+        context['plotlyjs'] = get_plotlyjs()
+        context['selected_data_sources'] = filters.get('data_sources', [])
+        context['selected_campaigns'] = filters.get('campaigns', [])
+        context['date_from'] = filters.get('date_from')
+        context['date_to'] = filters.get('date_to')
+        context['granularity'] = filters.get('granularity', 'day')
+        context['granularities'] = GRANULARITIES
+        context['metrics'] = METRICS
+        context['selected_metrics'] = metrics
+        context['window'] = filters.get(
+            'window', settings.MOVING_AVERAGE_WINDOW
+        )
+        return context
+
+
+class SearchView(ReplicaReadMixin, View):
+    """
+    Campaign (dimension=campaign) or data source (dimension=data_source)
+    names of the latest snapshot containing q, or starting with it with
+    match=prefix. Results are paginated by name: `next` is the `after`
+    value of the next page.
+    """
+    def get(self, request, *args, **kwargs):
+        dimension = request.GET.get('dimension', 'campaign')
+        if dimension not in SEARCH_MODELS:
+            return HttpResponseBadRequest(f'Unknown dimension: {dimension}')
+
+        try:
+            limit = int(request.GET.get('limit', settings.SEARCH_PAGE_SIZE))
+        except ValueError:
+            return HttpResponseBadRequest('limit must be a number')
+        limit = max(1, min(limit, settings.SEARCH_MAX_PAGE_SIZE))
+
+        query = request.GET.get('q', '')
+        qs = SEARCH_MODELS[dimension].objects.annotate(
+            in_snapshot=Exists(get_published_rows().filter(
+                date_created=FiltersMixin._get_latest_date_created(),
+                **{dimension: OuterRef('pk')},
+            )),
         ).filter(
-            date_created=Subquery(newest.values('date_created')[:1]),
+            in_snapshot=True,
+        ).order_by('name')
+        if request.GET.get('match') == 'prefix':
+            qs = qs.filter(name__istartswith=query)
+        else:
+            qs = qs.filter(name__icontains=query)
+
+        after = request.GET.get('after')
+        if after:
+            qs = qs.filter(name__gt=after)
+
+        names = list(qs.values_list('name', flat=True).distinct()[:limit + 1])
+        return JsonResponse({
+            'results': names[:limit],
+            'next': names[limit - 1] if len(names) > limit else None,
+        })
+
+
+class DataView(DatasetConditionalMixin, FiltersMixin, View):
+    """
+    Filtered series, with the requested metrics, as JSON. With
+    approximate=1, totals are estimated from a sample of the data, with
+    their error bounds and the percent of the data sampled. With width, the
+    plot traces are sent instead of the series, downsampled for that width
+    like the dashboard's.
+    """
+    def get(self, request, *args, **kwargs):
+        filters = self.get_filters()
+        data: Dict[str, Any] = {}
+        if request.GET.get('approximate'):
+            series, data['sample_percent'] = self._get_approximate_data(
+                filters,
+            )
+        else:
+            series = list(self._get_filtered_data(filters))
+        if 'width' in request.GET:
+            traces = IndexView._get_traces(
+                series,
+                IndexView._get_max_points(request.GET['width']),
+                filters.get('metrics', []),
+            )
+            data['traces'] = [trace.to_plotly_json() for trace in traces]
+        else:
+            data['series'] = series
+        return JsonResponse(data)
+
+
+class ComparisonView(DatasetConditionalMixin, FiltersMixin, View):
+    """
+    Filtered series compared against either the previous period of the same
+    length (compare=previous_period, needs from and to) or the previous
+    stored snapshot (compare=previous_snapshot), with absolute and relative
+    deltas. Both sides are aggregated in a single query, using FILTER
+    clauses.
+    """
+    def get(self, request, *args, **kwargs):
+        compare = request.GET.get('compare', 'previous_snapshot')
+        if compare not in COMPARISONS:
+            return HttpResponseBadRequest(f'Unknown comparison: {compare}')
+
+        filters = self.get_filters()
+        if compare == 'previous_period':
+            if not filters.get('date_from') or not filters.get('date_to'):
+                return HttpResponseBadRequest(
+                    'Comparing periods needs both from and to'
+                )
+            qs = self._get_period_comparison(filters)
+        else:
+            qs = self._get_snapshot_comparison(filters)
+
+        return JsonResponse({'compare': compare, 'series': list(qs)})
+
+    @classmethod
+    def _get_period_comparison(cls, filters) -> QuerySet:
+        """
+        Rows of the previous period get shifted by the period length, so both
+        periods share the same series of dates.
+        """
+        date_from = filters['date_from']
+        length = filters['date_to'] - date_from + timedelta(days=1)
+        aligned_date = Case(
+            When(date__gte=date_from, then=F('date')),
+            default=Cast(
+                ExpressionWrapper(
+                    F('date') + length, output_field=DateTimeField(),
+                ),
+                DateField(),
+            ),
+            output_field=DateField(),
+        )
+        qs = cls._filter_rows(
+            get_published_rows().filter(
+                date_created=cls._get_latest_date_created(),
+            ),
+            dict(filters, date_from=date_from - length),
+        )
+        return cls._compare(
+            qs, filters, aligned_date,
+            current=Q(date__gte=date_from),
+            previous=Q(date__lt=date_from),
+        )
+
+    @classmethod
+    def _get_snapshot_comparison(cls, filters) -> QuerySet:
+        latest = cls._get_latest_date_created()
+        previous = Subquery(
+            get_published_rows().filter(
+                date_created__lt=latest,
+            ).order_by(
+                '-date_created',
+            ).values('date_created')[:1]
+        )
+        qs = cls._filter_rows(
+            get_published_rows().filter(
+                Q(date_created=latest) | Q(date_created=previous),
+            ),
+            filters,
+        )
+        return cls._compare(
+            qs, filters, F('date'),
+            current=Q(date_created=latest),
+            previous=Q(date_created=previous),
+        )
+
+    @classmethod
+    def _compare(cls, qs: QuerySet, filters, date_expression, current: Q,
+                 previous: Q) -> QuerySet:
+        period = cls._get_period(
+            filters.get('granularity', 'day'), date_expression,
+        )
+        totals = {}
+        deltas = {}
+        for column in ('clicks', 'impressions'):
+            current_total = Coalesce(Sum(column, filter=current), 0)
+            previous_total = Coalesce(Sum(column, filter=previous), 0)
+            totals[f'{column}_current'] = current_total
+            totals[f'{column}_previous'] = previous_total
+            deltas[f'{column}_delta'] = ExpressionWrapper(
+                current_total - previous_total,
+                output_field=IntegerField(),
+            )
+            deltas[f'{column}_delta_relative'] = ExpressionWrapper(
+                Cast(current_total - previous_total, FloatField()) /
+                NullIf(previous_total, 0),
+                output_field=FloatField(),
+            )
+
+        return qs.annotate(
+            period=period,
+        ).values(
+            'period',
+        ).annotate(
+            **totals,
+            **deltas,
+        ).order_by(
+            'period',
+        )
+
+
+class BreakdownView(DatasetConditionalMixin, FiltersMixin, View):
+    """
+    Top n campaigns or data sources (by=campaign|data_source) by a metric
+    (metric=clicks|impressions), with the rest collapsed into `other`. With
+    series=1, it also returns the series of each of the top n.
+    """
+    def get(self, request, *args, **kwargs):
+        by = request.GET.get('by', 'campaign')
+        metric = request.GET.get('metric', 'clicks')
+        if by not in BREAKDOWN_DIMENSIONS:
+            return HttpResponseBadRequest(f'Unknown dimension: {by}')
+        if metric not in BREAKDOWN_METRICS:
+            return HttpResponseBadRequest(f'Unknown metric: {metric}')
+
+        try:
+            n = int(request.GET.get('n', settings.BREAKDOWN_SIZE))
+        except ValueError:
+            return HttpResponseBadRequest('n must be a number')
+        n = max(1, min(n, settings.BREAKDOWN_MAX_SIZE))
+
+        filters = self.get_filters()
+        top, other = self._get_breakdown(filters, by, metric, n)
+        data = {'by': by, 'metric': metric, 'top': top, 'other': other}
+        if request.GET.get('series'):
+            data['series'] = self._get_breakdown_series(
+                filters, by, [obj['name'] for obj in top],
+            )
+        return JsonResponse(data)
+
+    @classmethod
+    def _get_breakdown(cls, filters, by: str, metric: str,
+                       n: int) -> Tuple[List[dict], Optional[dict]]:
+        """
+        Ranks the groups with a window function and collapses the ones
+        ranked after n, all in one statement.
+        """
+        ranked = cls._get_filtered_rows(filters).annotate(
+            name=F(f'{by}__name'),
+        ).values(
+            'name',
+        ).annotate(
+            clicks_total=Sum('clicks'),
+            impressions_total=Sum('impressions'),
+            rank=Window(
+                RowNumber(),
+                order_by=[Sum(metric).desc(), F('name').asc()],
+            ),
+        ).order_by()
+        sql, params = ranked.query.sql_with_params()
+
+        with connections[ranked.db].cursor() as cursor:
+            cursor.execute(
+                f'''SELECT CASE WHEN "rank" <= %s THEN "name" END,
+                          SUM("clicks_total"),
+                          SUM("impressions_total"),
+                          COUNT(*)
+                   FROM ({sql}) ranked
+                   GROUP BY 1
+                   ORDER BY MIN("rank")''',
+                (n, *params),
+            )
+            rows = cursor.fetchall()
+
+        top = []
+        other = None
+        for name, clicks_total, impressions_total, members in rows:
+            obj = {
+                'clicks_total': int(clicks_total),
+                'impressions_total': int(impressions_total),
+            }
+            if name is None:
+                other = dict(obj, members=members)
+            else:
+                top.append(dict(obj, name=name))
+        return top, other
+
+    @classmethod
+    def _get_breakdown_series(cls, filters, by: str,
+                              names: List[str]) -> Dict[str, list]:
+        period = cls._get_period(filters.get('granularity', 'day'))
+        qs = cls._get_filtered_rows(filters).filter(
+            **{f'{by}__name__in': names},
+        ).annotate(
+            period=period,
+            name=F(f'{by}__name'),
+        ).values(
+            'name', 'period',
         ).annotate(
             clicks_total=Sum('clicks'),
             impressions_total=Sum('impressions'),
         ).order_by(
-            'date'
+            'name', 'period',
         )
 
-        if filters.get('data_sources'):
-            qs = qs.filter(data_source__name__in=filters['data_sources'])
+        series: Dict[str, list] = {name: [] for name in names}
+        for obj in qs:
+            series[obj.pop('name')].append(obj)
+        return series
 
-        if filters.get('campaigns'):
-            qs = qs.filter(campaign__name__in=filters['campaigns'])
 
-        return qs
+class Echo:
+    """
+    File-like object returning what gets written, so csv.writer can be used
+    to build each line of a streaming response.
+    """
+    def write(self, value: str) -> str:
+        return value
 
-    @staticmethod
-    def _get_distinct(column_name: str):
-        newest = RowData.objects.order_by('-id')
-        qs = RowData.objects.values_list(
-            column_name, flat=True,
-        ).filter(
-            date_created=Subquery(newest.values('date_created')[:1]),
-        ).distinct(
-            column_name,
+
+class ExportView(DatasetConditionalMixin, FiltersMixin, View):
+    """
+    Streams the filtered aggregates (kind=aggregates) or raw rows (kind=rows)
+    as CSV (format=csv) or newline-delimited JSON (format=ndjson). Rows are
+    read with a server-side cursor, so memory does not grow with the export.
+    """
+    def get(self, request, *args, **kwargs):
+        kind = request.GET.get('kind', 'aggregates')
+        export_format = request.GET.get('format', 'csv')
+        if kind not in EXPORT_COLUMNS:
+            return HttpResponseBadRequest(f'Unknown kind: {kind}')
+        if export_format not in EXPORT_CONTENT_TYPES:
+            return HttpResponseBadRequest(f'Unknown format: {export_format}')
+
+        filters = self.get_filters()
+        columns = EXPORT_COLUMNS[kind]
+        if kind == 'aggregates':
+            columns += tuple(filters.get('metrics', []))
+            qs = self._get_filtered_data(filters)
+        else:
+            qs = self._get_filtered_rows(filters).order_by('id')
+        # Rows are read once streaming, out of the replica_reads() block
+        qs = qs.using(router.db_for_read(RowData))
+        rows = qs.values_list(*columns).iterator(
+            chunk_size=settings.EXPORT_CHUNK_SIZE,
         )
-        return qs
 
-    def get_context_data(self, **kwargs):
-        refresh_db()
+        if export_format == 'csv':
+            content = self._get_csv_lines(columns, rows)
+        else:
+            content = self._get_ndjson_lines(columns, rows)
 
-        filters = {}
-        selected_data_sources = self.request.GET.getlist('data-sources')
-        if selected_data_sources:
-            filters['data_sources'] = selected_data_sources
+        response = StreamingHttpResponse(
+            content, content_type=EXPORT_CONTENT_TYPES[export_format],
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{kind}.{export_format}"'
+        )
+        return response
 
-        selected_campaigns = self.request.GET.getlist('campaigns')
-        if selected_campaigns:
-            filters['campaigns'] = selected_campaigns
+    @staticmethod
+    def _get_header(columns: tuple) -> list:
+        return [column.replace('__name', '') for column in columns]
 
-        qs = self._get_filtered_data(filters)
-        plot_div = self._get_plot_div(qs)
+    @classmethod
+    def _get_csv_lines(cls, columns: tuple, rows: Iterator) -> Iterator[str]:
+        writer = csv.writer(Echo())
+        yield writer.writerow(cls._get_header(columns))
+        for row in rows:
+            yield writer.writerow(row)
 
-        context = super().get_context_data(**kwargs)
-        context['plot_div'] = plot_div
-        context['data_sources'] = self._get_distinct('data_source__name')
-        context['campaigns'] = self._get_distinct('campaign__name')
-        context['selected_data_sources'] = selected_data_sources
-        context['selected_campaigns'] = selected_campaigns
-        return context
+    @classmethod
+    def _get_ndjson_lines(cls, columns: tuple,
+                          rows: Iterator) -> Iterator[str]:
+        header = cls._get_header(columns)
+        for row in rows:
+            yield json.dumps(dict(zip(header, row)), cls=DjangoJSONEncoder)
+            yield '\n'
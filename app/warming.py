@@ -0,0 +1,149 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, timedelta
+import hashlib
+import json
+import logging
+import random
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.utils import IntegrityError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import FilterSelection
+
+logger = logging.getLogger(__name__)
+
+DATE_FILTERS = ('date_from', 'date_to')
+
+# Warms the cache in the background, one warming at a time. Its thread is
+# joined at exit, so management commands still warm the cache.
+executor = ThreadPoolExecutor(max_workers=1)
+
+
+def serialize_filters(filters: dict) -> str:
+    """
+    JSON of the filters, the same for every equivalent selection: lists get
+    deduplicated and sorted, keys sorted and dates in ISO format.
+    """
+    normalized = {}
+    for name, value in filters.items():
+        if isinstance(value, list):
+            value = sorted(set(value))
+        elif isinstance(value, date):
+            value = value.isoformat()
+        normalized[name] = value
+    return json.dumps(normalized, sort_keys=True)
+
+
+def deserialize_filters(value: str) -> dict:
+    filters = json.loads(value)
+    for name in DATE_FILTERS:
+        if name in filters:
+            filters[name] = parse_date(filters[name])
+    return filters
+
+
+def get_selection_key(filters: dict, max_points: Optional[int]) -> str:
+    key = f'{serialize_filters(filters)}:{max_points}'
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def record_selection(filters: dict, max_points: Optional[int]) -> None:
+    """
+    Counts a dashboard request for the filters and point budget. Only a
+    FILTER_SELECTION_SAMPLE_RATE share of the requests get counted, so most
+    of them do not write to the primary database: the most requested
+    selections still get the most hits.
+    """
+    if random.random() >= settings.FILTER_SELECTION_SAMPLE_RATE:
+        return
+
+    key = get_selection_key(filters, max_points)
+    updated = FilterSelection.objects.filter(key=key).update(
+        hits=F('hits') + 1,
+        date_last_used=timezone.now(),
+    )
+    if updated:
+        return
+
+    try:
+        with transaction.atomic():
+            FilterSelection.objects.create(
+                key=key,
+                filters=serialize_filters(filters),
+                max_points=max_points,
+                hits=1,
+            )
+    except IntegrityError:
+        # Created by a concurrent request in the meantime
+        FilterSelection.objects.filter(key=key).update(
+            hits=F('hits') + 1,
+            date_last_used=timezone.now(),
+        )
+
+
+def get_popular_selections(
+        size: int) -> List[Tuple[dict, Optional[int]]]:
+    """
+    Filters and point budget of the `size` most requested dashboards.
+    """
+    qs = FilterSelection.objects.order_by(
+        '-hits', '-date_last_used',
+    ).values_list('filters', 'max_points')[:size]
+    return [
+        (deserialize_filters(filters), max_points)
+        for filters, max_points in qs
+    ]
+
+
+def warm_cache(sender=None, **kwargs) -> Future:
+    """
+    Receiver of data_stored: schedules warm_dashboards in the background,
+    so storing the data does not wait for it.
+    """
+    return executor.submit(warm_dashboards)
+
+
+def warm_dashboards() -> None:
+    """
+    Forgets the selections unused for FILTER_SELECTION_MAX_AGE_DAYS, then
+    computes and caches the CACHE_WARMING_SIZE most requested dashboards for
+    the current data, using up to CACHE_WARMING_WORKERS threads.
+    """
+    # Imported here, the views depend on this module
+    from .views import IndexView
+
+    try:
+        FilterSelection.objects.filter(
+            date_last_used__lt=timezone.now() - timedelta(
+                days=settings.FILTER_SELECTION_MAX_AGE_DAYS,
+            ),
+        ).delete()
+        selections = get_popular_selections(settings.CACHE_WARMING_SIZE)
+    except Exception:
+        logger.exception('Could not get the dashboards to warm')
+        return
+    finally:
+        connection.close()
+    if not selections:
+        return
+
+    def warm(selection: Tuple[dict, Optional[int]]) -> None:
+        filters, max_points = selection
+        try:
+            IndexView().get_dashboard(filters, max_points)
+        except Exception:
+            logger.exception('Could not warm the dashboard for %r', filters)
+        finally:
+            # Every thread opens its own connection
+            connection.close()
+
+    with ThreadPoolExecutor(
+        max_workers=settings.CACHE_WARMING_WORKERS,
+    ) as pool:
+        list(pool.map(warm, selections))
+    logger.info('Warmed up %d dashboards', len(selections))